@@ -5,13 +5,21 @@ import io
 import os
 import base64
 import json
+import logging
 import re
+import csv
+import tempfile
+import unicodedata
 import altair as alt
 from datetime import date, timedelta, datetime
 from jinja2 import Template
-from sqlalchemy import create_engine, Column, Integer, String, Float, DateTime, Text, inspect, Boolean
+from pricing import MODEL_PARAMS, STD_LENGTHS, MIN_MODULE_LEN_MM, STANDARD_MODULE_LEN_MM, POLY_MATERIALS, calculate_cutting_plans, calculate_offer_items, solid_poly_parts
+from sqlalchemy import create_engine, Column, Integer, String, Float, Date, DateTime, Text, inspect, Boolean, Index
 from sqlalchemy.orm import sessionmaker, declarative_base
-from sqlalchemy import func
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy import func, or_, select, cast, text, table, column, literal, literal_column
+from sqlalchemy.dialects.postgresql import JSONB, insert as pg_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
 
 # --- VERZE APLIKACE ---
 APP_VERSION = "76.0 (Three Geometry Groups)"
@@ -19,39 +27,31 @@ APP_VERSION = "76.0 (Three Geometry Groups)"
 # --- HESLO ADMINA ---
 ADMIN_PASSWORD = "admin123"
 
-# --- KONFIGURACE VÝROBY ---
-ROOF_OVERLAP_MM = 100 
-FACE_WASTE_COEF = 0.82 
-MIN_MODULE_LEN_MM = 1800 
-STANDARD_MODULE_LEN_MM = 2190
-
-# --- KATEGORIE MODELŮ (DEFINICE DLE UŽIVATELE) ---
-# 1. BOX: Nízké, hranaté (Flash, Wing, Dream) -> Málo poly, Hodně profilu (Rám)
-BOX_MODELS = ["FLASH", "WING", "DREAM"]
-
-# 2. HIGH: Vysoké, svislé stěny (Rock, Terrace, Harmony, Sunset, Wave) -> Korekce oproti bublině
-HIGH_MODELS = ["TERRACE", "ROCK", "HARMONY", "SUNSET", "WAVE"]
-
-# 3. ARCH: Střední, obloukové (Practic, Horizont, Star) -> Čistá geometrie
-ARCH_MODELS = ["PRACTIC", "HORIZONT", "STAR", "DEFAULT"]
-
-# --- DEFINICE MODELŮ ---
-MODEL_PARAMS = {
-    "PRACTIC":  {"step_w": 100, "step_h": 50, "img": "practic.png"},
-    "DREAM":    {"step_w": 130, "step_h": 65, "img": "dream.png"},
-    "HARMONY":  {"step_w": 130, "step_h": 65, "img": "harmony.png"},
-    "ROCK":     {"step_w": 130, "step_h": 65, "img": "rock.png"},
-    "TERRACE":  {"step_w": 71,  "step_h": 65, "img": "terrace.png"}, 
-    "HORIZONT": {"step_w": 130, "step_h": 65, "img": "horizont.png"}, 
-    "STAR":     {"step_w": 130, "step_h": 65, "img": "star.png"},
-    "WAVE":     {"step_w": 146, "step_h": 70, "img": "wave.png"},
-    "FLASH":    {"step_w": 146, "step_h": 70, "img": "flash.png"},
-    "WING":     {"step_w": 130, "step_h": 65, "img": "wing.png"},
-    "SUNSET":   {"step_w": 130, "step_h": 65, "img": "sunset.png"},
-    "DEFAULT":  {"step_w": 100, "step_h": 50, "img": None}
-}
-
-STD_LENGTHS = {2: 4336, 3: 6446, 4: 8556, 5: 10666, 6: 12776, 7: 14886}
+# --- HISTORIE CEN ---
+# Platnost prvního záznamu v historii (ceny před zavedením historie = první známé ceny)
+HISTORY_START = datetime(2000, 1, 1)
+CENIK_FIELDS = ["model", "sirka_mm", "moduly", "cena", "vyska", "delka_fix"]
+PRIPLATEK_FIELDS = ["nazev", "cena_fix", "cena_pct", "kategorie"]
+
+# --- EXPORT ARCHIVU ---
+EXPORT_BATCH_SIZE = 1000
+# Připravené exporty čekají na stažení v dočasném adresáři (lze stáhnout opakovaně), mažou se po EXPORT_MAX_AGE_S
+EXPORT_DIR = os.path.join(tempfile.gettempdir(), "rentmil_exporty")
+EXPORT_MAX_AGE_S = 3600
+EXPORT_BASE_COLUMNS = ["id", "datum_vytvoreni", "zakaznik", "model", "cena_celkem"]
+EXPORT_JSON_FIELDS = [
+    "vypracoval", "zak_adresa", "zak_tel", "zak_email", "sirka", "moduly", "celkova_delka", "pocet_prod_modulu", "vyska_mm", "zvyseni_cm",
+    "barva_typ", "ral_kod", "poly_strecha", "poly_celo_male", "poly_celo_velke", "change_color_poly", "poly_dle_planu",
+    "pocet_dvere_vc", "dvere_vc_sirka", "pocet_dvere_bok", "zamykaci_klika", "uzamykani_segmentu", "klapka",
+    "bez_maleho_cela", "bez_velkeho_cela", "vyklopne_celo", "pochozi_koleje", "pochozi_koleje_zdarma", "obousmerne_koleje",
+    "ext_draha_m", "podhori", "km", "cena_za_km", "montaz", "sleva_pct", "dph_sazba", "cena_bez_dph", "termin_dodani", "platnost_dny",
+]
+
+# --- VYHLEDÁVÁNÍ V ARCHIVU ---
+# Postgres: tabulka s trigramovým GIN indexem (pg_trgm), SQLite: FTS5 (rowid = id nabídky)
+SEARCH_TABLE = "nabidky_hledani"
+ARCHIVE_PAGE_SIZE = 50
+
 
 try:
     from playwright.sync_api import sync_playwright
@@ -106,6 +106,58 @@ class Priplatek(Base):
     cena_pct = Column(Float)
     kategorie = Column(String)
 
+# Historie cen: každý řádek platí v intervalu <platne_od, platne_do), platne_do = NULL -> aktuální
+class CenikHistorie(Base):
+    __tablename__ = 'cenik_historie'
+    id = Column(Integer, primary_key=True)
+    cenik_id = Column(Integer, nullable=False)
+    model = Column(String)
+    sirka_mm = Column(Integer)
+    moduly = Column(Integer)
+    cena = Column(Float)
+    vyska = Column(Float)
+    delka_fix = Column(Float)
+    platne_od = Column(DateTime, nullable=False)
+    platne_do = Column(DateTime)
+    __table_args__ = (
+        Index('ix_cenik_historie_lookup', 'model', 'moduly', 'platne_od', 'sirka_mm'),
+        Index('ix_cenik_historie_asof', 'platne_od', 'platne_do'),
+        Index('ix_cenik_historie_zaznam', 'cenik_id', 'platne_do'),
+        # Nejvýš jeden otevřený řádek na položku ceníku (ochrana proti souběžnému dorovnání)
+        Index('ux_cenik_historie_otevrene', 'cenik_id', unique=True, postgresql_where=text('platne_do IS NULL'), sqlite_where=text('platne_do IS NULL')),
+    )
+
+class PriplatekHistorie(Base):
+    __tablename__ = 'priplatky_historie'
+    id = Column(Integer, primary_key=True)
+    priplatek_id = Column(Integer, nullable=False)
+    nazev = Column(String)
+    cena_fix = Column(Float)
+    cena_pct = Column(Float)
+    kategorie = Column(String)
+    platne_od = Column(DateTime, nullable=False)
+    platne_do = Column(DateTime)
+    __table_args__ = (
+        Index('ix_priplatky_historie_lookup', 'kategorie', 'platne_od'),
+        Index('ix_priplatky_historie_asof', 'platne_od', 'platne_do'),
+        Index('ix_priplatky_historie_zaznam', 'priplatek_id', 'platne_do'),
+        Index('ux_priplatky_historie_otevrene', 'priplatek_id', unique=True, postgresql_where=text('platne_do IS NULL'), sqlite_where=text('platne_do IS NULL')),
+    )
+
+# Souhrny prodeje (obdobi_typ: M = měsíc, W = týden od pondělí), udržované průběžně při ukládání/mazání nabídek
+class ProdejSouhrn(Base):
+    __tablename__ = 'prodej_souhrny'
+    id = Column(Integer, primary_key=True)
+    obdobi_typ = Column(String(1), nullable=False)
+    obdobi = Column(Date, nullable=False)
+    vypracoval = Column(String, nullable=False)
+    model = Column(String, nullable=False)
+    pocet = Column(Integer, default=0)
+    obrat = Column(Float, default=0.0)
+    __table_args__ = (
+        Index('ux_prodej_souhrny_klic', 'obdobi_typ', 'obdobi', 'vypracoval', 'model', unique=True),
+    )
+
 db_url = os.environ.get("DATABASE_URL")
 engine = None
 SessionLocal = None
@@ -128,126 +180,87 @@ def parse_value_clean(val):
     try: return float(s.replace(',', '.'))
     except: return 0
 
-def geometry_segment_values(width_mm, height_mm):
-    """Vrací (Plocha_pro_výrobu, Délka_oblouku_mm, Čistá_geometrická_plocha)"""
-    if width_mm <= 0: return 0, 0, 0
-    if height_mm <= 0: height_mm = 1
-    s = width_mm
-    v = height_mm
-    try:
-        R = ((s**2 / 4) + v**2) / (2 * v)
-        if R <= 0: arc_len = s
-        else:
-            ratio = s / (2 * R)
-            if ratio > 1: ratio = 1
-            if ratio < -1: ratio = -1
-            alpha_rad = 2 * math.asin(ratio)
-            arc_len = alpha_rad * R
-    except: arc_len = s
-
-    raw_rect_area = (s * v) / 1_000_000 
-    production_area = raw_rect_area * FACE_WASTE_COEF # Pouze pro čela
-    return production_area, arc_len, raw_rect_area
-
-def calculate_smart_geometry(model_name, width_input_mm, height_input_mm, modules, total_length_mm):
+def price_source_id(tbl):
+    """Id položky ceníku - u historie odkaz na zdrojový řádek (pořadí aktuálních i historických dotazů je stejné)."""
+    return {CenikHistorie: CenikHistorie.cenik_id, PriplatekHistorie: PriplatekHistorie.priplatek_id}.get(tbl, tbl.id)
+
+def price_query(session, table, as_of=None):
     """
-    Chytrý výpočet geometrie pro 3 skupiny modelů: BOX, HIGH, ARCH.
-    Vrací: (Plocha Poly pro cenu, Plocha čel, Délka konstrukce pro prodloužení)
+    Vrací (dotaz, tabulka). Bez as_of -> aktuální ceník, s as_of -> stav historie k danému okamžiku.
+    Řazeno podle id položky - .first() u překrývajících se názvů (ilike) vybere stejný řádek jako aktuální ceník i replay.
     """
-    params = MODEL_PARAMS.get(model_name.upper(), MODEL_PARAMS["DEFAULT"])
-    step_w = params["step_w"]
-    step_h = params["step_h"]
-
-    # 1. Základní geometrie segmentů (Malý a Velký)
-    w_small = width_input_mm
-    h_small = height_input_mm
-    area_face_small, arc_small, _ = geometry_segment_values(w_small, h_small)
-    
-    w_large = width_input_mm + ((modules - 1) * step_w)
-    h_large = height_input_mm + ((modules - 1) * step_h)
-    area_face_large, arc_large, _ = geometry_segment_values(w_large, h_large)
-    
-    avg_arc_len_mm = (arc_small + arc_large) / 2.0
-    avg_width = (w_small + w_large) / 2.0
-    avg_height = (h_small + h_large) / 2.0
-
-    # 2. LOGIKA DLE SKUPIN (The Three Sisters Logic)
-    
-    model_cat = "ARCH"
-    if model_name.upper() in BOX_MODELS: model_cat = "BOX"
-    elif model_name.upper() in HIGH_MODELS: model_cat = "HIGH"
-    
-    poly_correction = 1.0
-    struct_len_mm = avg_arc_len_mm # Default
-
-    if model_cat == "BOX":
-        # FLASH, WING, DREAM
-        # Poly: Placka (korekce 0.8)
-        poly_correction = 0.80 
-        # Konstrukce: Rám (Šířka + 2*Výška) - mnohem víc materiálu než oblouk
-        struct_len_mm = avg_width + (1.8 * avg_height)
-        
-    elif model_cat == "HIGH":
-        # ROCK, TERRACE, HARMONY
-        # Poly: Svislé stěny (korekce 0.85, aby nebyla bublina)
-        poly_correction = 0.85
-        # Konstrukce: Oblouk s korekcí (nebo čistý oblouk, dle Rock testu)
-        struct_len_mm = avg_arc_len_mm * 0.9 # Lehká korekce, Rock má méně "masa" než plná bublina
-        
-    else: # ARCH (PRACTIC, HORIZONT)
-        # Poly: Čistý oblouk
-        poly_correction = 1.0
-        # Konstrukce: Čistý oblouk
-        struct_len_mm = avg_arc_len_mm
-
-    # 3. Finální hodnoty
-    total_roof_area_poly = (avg_arc_len_mm / 1000.0) * (total_length_mm / 1000.0) * poly_correction
-    total_struct_len_m_sum = (struct_len_mm * modules) / 1000.0
-    
-    return total_roof_area_poly, area_face_large, area_face_small, total_struct_len_m_sum, model_cat
-
-def get_surcharge_db(search_term, is_rock=False):
+    if as_of is None: return session.query(table).order_by(table.id), table
+    hist = {Cenik: CenikHistorie, Priplatek: PriplatekHistorie}[table]
+    return session.query(hist).filter(hist.platne_od <= as_of, or_(hist.platne_do.is_(None), hist.platne_do > as_of)).order_by(price_source_id(hist)), hist
+
+def get_surcharge_db(search_term, is_rock=False, as_of=None):
     if not SessionLocal: return {"fix": 0, "pct": 0}
     session = SessionLocal()
     cat = "Rock" if is_rock else "Standard"
     try:
-        item = session.query(Priplatek).filter(Priplatek.kategorie == cat, Priplatek.nazev.ilike(f"%{search_term}%")).first()
+        q, tbl = price_query(session, Priplatek, as_of)
+        item = q.filter(tbl.kategorie == cat, tbl.nazev.ilike(f"%{search_term}%")).first()
         if not item and is_rock: 
-             item = session.query(Priplatek).filter(Priplatek.kategorie == "Standard", Priplatek.nazev.ilike(f"%{search_term}%")).first()
+             item = q.filter(tbl.kategorie == "Standard", tbl.nazev.ilike(f"%{search_term}%")).first()
         if item:
             return {"fix": item.cena_fix or 0, "pct": item.cena_pct or 0}
         return {"fix": 0, "pct": 0}
     finally: session.close()
 
-def get_rail_price_from_db(modules):
+def get_rail_price_from_db(modules, as_of=None):
     if not SessionLocal: return DEFAULT_RAIL_PRICES.get(modules, 0)
     session = SessionLocal()
     try:
         search_name = f"Koleje prodloužení {modules} mod"
-        item = session.query(Priplatek).filter(Priplatek.nazev.ilike(f"%{search_name}%")).first()
+        q, tbl = price_query(session, Priplatek, as_of)
+        item = q.filter(tbl.nazev.ilike(f"%{search_name}%")).first()
         if item and item.cena_fix > 0: return item.cena_fix
         else: return DEFAULT_RAIL_PRICES.get(modules, 0)
     finally: session.close()
 
-def calculate_base_price_db(model, width_mm, modules):
+def calculate_base_price_db(model, width_mm, modules, as_of=None):
     if not SessionLocal: return 0,0, "DB Error"
     session = SessionLocal()
     try:
-        count = session.query(Cenik).filter(Cenik.model == model).count()
+        q, tbl = price_query(session, Cenik, as_of)
+        count = q.filter(tbl.model == model).count()
         if count == 0: return 0, 0, f"Ceník pro {model} je prázdný!"
-        row = session.query(Cenik).filter(
-            Cenik.model == model,
-            Cenik.moduly == modules,
-            Cenik.sirka_mm >= width_mm
-        ).order_by(Cenik.sirka_mm.asc()).first()
+        row = q.filter(
+            tbl.model == model,
+            tbl.moduly == modules,
+            tbl.sirka_mm >= width_mm
+        ).order_by(None).order_by(tbl.sirka_mm.asc(), price_source_id(tbl)).first()
         if row: return row.cena, row.vyska * 1000, None
         else:
-            max_row = session.query(Cenik).filter(Cenik.model == model, Cenik.moduly == modules).order_by(Cenik.sirka_mm.desc()).first()
+            max_row = q.filter(tbl.model == model, tbl.moduly == modules).order_by(None).order_by(tbl.sirka_mm.desc(), price_source_id(tbl)).first()
             if max_row: return 0, 0, f"Mimo rozsah (Max pro {model} je {max_row.sirka_mm} mm)"
             return 0, 0, "Rozměr nebo počet modulů nenalezen"
     except Exception as e: return 0,0, str(e)
     finally: session.close()
 
+def offer_salesperson(data_json):
+    return json.loads(data_json).get('vypracoval', 'Neznámý') if data_json else 'Neznámý'
+
+def _rollup_periods(ts):
+    d = ts.date()
+    return [("M", d.replace(day=1)), ("W", d - timedelta(days=d.weekday()))]
+
+def _apply_sales_rollup(session, ts, vypracoval, model, cena, sign):
+    """Přičte (sign=1) nebo odečte (sign=-1) nabídku v souhrnech - ve stejné transakci jako změna nabídky."""
+    delta = sign * (cena or 0)
+    # Atomický upsert (souběžné uložení stejného klíče, např. dvě záložky v novém týdnu)
+    upsert = {'postgresql': pg_insert, 'sqlite': sqlite_insert}.get(session.bind.dialect.name)
+    for typ, obdobi in _rollup_periods(ts):
+        keys = {'obdobi_typ': typ, 'obdobi': obdobi, 'vypracoval': vypracoval, 'model': model}
+        if upsert:
+            stmt = upsert(ProdejSouhrn).values(**keys, pocet=sign, obrat=delta)
+            session.execute(stmt.on_conflict_do_update(index_elements=list(keys), set_={'pocet': ProdejSouhrn.pocet + sign, 'obrat': ProdejSouhrn.obrat + delta}))
+            continue
+        updated = session.query(ProdejSouhrn).filter_by(**keys).update(
+            {ProdejSouhrn.pocet: ProdejSouhrn.pocet + sign, ProdejSouhrn.obrat: ProdejSouhrn.obrat + delta},
+            synchronize_session=False)
+        if not updated: session.add(ProdejSouhrn(**keys, pocet=sign, obrat=delta))
+
 def save_offer_to_db(data_dict, total_price):
     if not SessionLocal: return False, "DB Error"
     session = SessionLocal()
@@ -262,6 +275,9 @@ def save_offer_to_db(data_dict, total_price):
             datum_vytvoreni=datetime.now()
         )
         session.add(nova_nabidka)
+        session.flush()
+        _index_offer_search(session, nova_nabidka.id, nova_nabidka.zakaznik, data_dict)
+        _apply_sales_rollup(session, nova_nabidka.datum_vytvoreni, obchodnik, nova_nabidka.model, total_price, 1)
         session.commit()
         return True, "Uloženo."
     except Exception as e: return False, str(e)
@@ -279,10 +295,267 @@ def delete_offer(offer_id):
     try:
         offer = session.query(Nabidka).filter(Nabidka.id == offer_id).first()
         if offer:
+            if offer.datum_vytvoreni:
+                _apply_sales_rollup(session, offer.datum_vytvoreni, offer_salesperson(offer.data_json), offer.model, offer.cena_celkem, -1)
             session.delete(offer)
+            session.flush()
+            _index_offer_search(session, offer.id)
             session.commit()
     finally: session.close()
 
+def rebuild_sales_rollups():
+    """Přepočítá souhrny prodeje z celého archivu (backfill, oprava po zásazích mimo aplikaci). Vrací počet řádků souhrnů."""
+    if not SessionLocal: return 0
+    session = SessionLocal()
+    try:
+        totals = {}
+        rows = session.query(Nabidka.datum_vytvoreni, Nabidka.model, Nabidka.cena_celkem, Nabidka.data_json).yield_per(1000)
+        for ts, model, cena, data_json in rows:
+            if ts is None: continue
+            vypracoval = offer_salesperson(data_json)
+            for typ, obdobi in _rollup_periods(ts):
+                key = (typ, obdobi, vypracoval, model)
+                pocet, obrat = totals.get(key, (0, 0.0))
+                totals[key] = (pocet + 1, obrat + (cena or 0))
+        session.query(ProdejSouhrn).delete(synchronize_session=False)
+        session.add_all([ProdejSouhrn(obdobi_typ=k[0], obdobi=k[1], vypracoval=k[2], model=k[3], pocet=v[0], obrat=v[1]) for k, v in totals.items()])
+        session.commit()
+        return len(totals)
+    finally: session.close()
+
+def ensure_sales_rollups():
+    """Prázdné souhrny při existujícím archivu (první spuštění po nasazení) se dopočítají z archivu."""
+    if not SessionLocal: return 0
+    session = SessionLocal()
+    try:
+        if session.query(ProdejSouhrn.id).first() or not session.query(Nabidka.id).first(): return 0
+    finally: session.close()
+    try: return rebuild_sales_rollups()
+    except IntegrityError: return 0  # souběžně dopočítala jiná session
+
+def cutting_plan_archive(time_budget_s=None):
+    """Plán řezání pro všechny uložené nabídky (dávkově, stejný výpočet jako v kalkulaci). Vrací DataFrame po nabídkách a materiálech."""
+    if not SessionLocal: return pd.DataFrame()
+    session = SessionLocal()
+    heights, rows = {}, []
+    try:
+        for offer_id, model, data_json in session.query(Nabidka.id, Nabidka.model, Nabidka.data_json).yield_per(1000):
+            data = json.loads(data_json) if data_json else {}
+            sirka, moduly = data.get('sirka'), data.get('moduly')
+            if not sirka or not moduly: continue
+            height = data.get('vyska_mm')
+            if not height:
+                key = (model, sirka, moduly)
+                if key not in heights: heights[key] = calculate_base_price_db(model, sirka, moduly)[1]
+                height = heights[key]
+            if not height: continue
+            delka = data.get('celkova_delka') or STD_LENGTHS.get(moduly, moduly * STANDARD_MODULE_LEN_MM)
+            try: plans = calculate_cutting_plans(model, sirka, height, moduly, delka, face_small=not data.get('bez_maleho_cela'), face_large=not data.get('bez_velkeho_cela'),
+                                                 solid_parts=solid_poly_parts(data), time_budget_s=time_budget_s)
+            except ValueError: continue
+            for material, plan in plans.items():
+                rows.append({'id': offer_id, 'model': model, 'material': POLY_MATERIALS[material], 'deska': f"{plan['deska'][0]}x{plan['deska'][1]}", 'pocet_desek': plan['pocet_desek'],
+                             'plocha_dilu_m2': plan['plocha_dilu_m2'], 'plocha_desek_m2': plan['plocha_desek_m2'], 'odpad_pct': plan['odpad_pct'], 'cas_ms': plan['cas_ms']})
+        return pd.DataFrame(rows)
+    finally: session.close()
+
+def json_field(col, key):
+    """Hodnota klíče z JSON textu přímo v SQL (Postgres JSONB, jinak json_extract)."""
+    if engine is not None and engine.dialect.name == "postgresql": return cast(col, JSONB)[key].astext
+    return func.json_extract(col, f"$.{key}")
+
+def offer_filter_conditions(datum_od=None, datum_do=None, modely=None, zakaznik=None, vypracovali=None):
+    """Filtry archivu (sdílené zobrazením archivu, vyhledáváním a exportem)."""
+    conds = []
+    if datum_od: conds.append(Nabidka.datum_vytvoreni >= datetime.combine(datum_od, datetime.min.time()))
+    if datum_do: conds.append(Nabidka.datum_vytvoreni < datetime.combine(datum_do + timedelta(days=1), datetime.min.time()))
+    if modely: conds.append(Nabidka.model.in_(modely))
+    if zakaznik: conds.append(Nabidka.zakaznik.ilike(f"%{zakaznik}%"))
+    if vypracovali:
+        vypracoval = json_field(Nabidka.data_json, 'vypracoval')
+        cond = vypracoval.in_(vypracovali)
+        if 'Neznámý' in vypracovali: cond = or_(cond, vypracoval.is_(None))
+        conds.append(cond)
+    return conds
+
+def flatten_offer(offer_id, datum, zakaznik, model, cena, data_json):
+    data = json.loads(data_json) if data_json else {}
+    row = [offer_id, datum, zakaznik, model, cena]
+    row.extend(data.get(f) for f in EXPORT_JSON_FIELDS)
+    if row[len(EXPORT_BASE_COLUMNS)] is None: row[len(EXPORT_BASE_COLUMNS)] = 'Neznámý'
+    return row
+
+def _write_export_csv(out, rows):
+    text = io.TextIOWrapper(out, encoding='utf-8-sig', newline='')
+    writer = csv.writer(text, delimiter=';')
+    writer.writerow(EXPORT_BASE_COLUMNS + EXPORT_JSON_FIELDS)
+    count = 0
+    for row in rows:
+        writer.writerow(row)
+        count += 1
+    text.flush()
+    text.detach()
+    return count
+
+def _write_export_xlsx(out, rows):
+    from openpyxl import Workbook
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet("Nabídky")
+    ws.append(EXPORT_BASE_COLUMNS + EXPORT_JSON_FIELDS)
+    count = 0
+    for row in rows:
+        ws.append(row)
+        count += 1
+    wb.save(out)
+    return count
+
+def export_offers(out, fmt="csv", query="", **filters):
+    """
+    Zapíše archiv nabídek do binárního souboru out (CSV nebo XLSX) po řádcích.
+    Čte se server-side kurzorem po dávkách, data_json se rozbalí řádek po řádku. Vrací počet nabídek.
+    """
+    if not SessionLocal: return 0
+    session = SessionLocal()
+    try:
+        source, search_conds, _ = offer_search(query)
+        stmt = (select(Nabidka.id, Nabidka.datum_vytvoreni, Nabidka.zakaznik, Nabidka.model, Nabidka.cena_celkem, Nabidka.data_json)
+                .select_from(source).where(*offer_filter_conditions(**filters), *search_conds).order_by(Nabidka.id)
+                .execution_options(stream_results=True, yield_per=EXPORT_BATCH_SIZE))
+        rows = (flatten_offer(*r) for r in session.execute(stmt))
+        if fmt == "xlsx": return _write_export_xlsx(out, rows)
+        return _write_export_csv(out, rows)
+    finally: session.close()
+
+def cleanup_exports(max_age_s=EXPORT_MAX_AGE_S):
+    """Smaže exporty starší než max_age_s (nestažené z ukončených session)."""
+    if not os.path.isdir(EXPORT_DIR): return
+    limit = datetime.now().timestamp() - max_age_s
+    for name in os.listdir(EXPORT_DIR):
+        path = os.path.join(EXPORT_DIR, name)
+        try:
+            if os.path.getmtime(path) < limit: os.remove(path)
+        except OSError: pass
+
+def read_export(path):
+    """
+    Obsah exportu pro stažení. Streamlit (MediaFileManager) drží stahovaný soubor celý v paměti,
+    proto se čte až při kliknutí - generování exportu jde po řádcích, samotné stažení ne.
+    """
+    with open(path, "rb") as f: return f.read()
+
+def search_backend():
+    if engine is None or engine.dialect.name not in ("postgresql", "sqlite"): return None
+    return engine.dialect.name
+
+def _search_table():
+    key = "rowid" if search_backend() == "sqlite" else "nabidka_id"
+    return table(SEARCH_TABLE, column(key), column("obsah")), key
+
+def ensure_search_index():
+    backend = search_backend()
+    with engine.begin() as conn:
+        if backend == "postgresql":
+            conn.execute(text("CREATE EXTENSION IF NOT EXISTS pg_trgm"))
+            conn.execute(text(f"CREATE TABLE IF NOT EXISTS {SEARCH_TABLE} (nabidka_id INTEGER PRIMARY KEY, obsah TEXT NOT NULL)"))
+            conn.execute(text(f"CREATE INDEX IF NOT EXISTS ix_{SEARCH_TABLE}_trgm ON {SEARCH_TABLE} USING gin (obsah gin_trgm_ops)"))
+        elif backend == "sqlite":
+            conn.execute(text(f"CREATE VIRTUAL TABLE IF NOT EXISTS {SEARCH_TABLE} USING fts5(obsah)"))
+        else: return 0
+        if conn.execute(text(f"SELECT 1 FROM {SEARCH_TABLE} LIMIT 1")).first() or not conn.execute(select(Nabidka.id).limit(1)).first(): return 0
+    # Prázdný index při existujícím archivu (první spuštění po nasazení) se naplní hned
+    try: return rebuild_search_index()
+    except IntegrityError: return 0  # souběžně naplnila jiná session
+
+def normalize_search_text(s):
+    """Malá písmena bez diakritiky - 'Plzeň' najde i 'plzen'."""
+    s = unicodedata.normalize("NFKD", s or "")
+    return "".join(c for c in s if not unicodedata.combining(c)).lower()
+
+def search_document(zakaznik, data):
+    tel = str(data.get('zak_tel') or "")
+    parts = [zakaznik, data.get('zak_adresa'), tel, re.sub(r"\D", "", tel), data.get('zak_email')]
+    return normalize_search_text(" ".join(str(p) for p in parts if p))
+
+def _index_offer_search(session, offer_id, zakaznik=None, data=None):
+    """
+    Aktualizace indexu vyhledávání (data=None -> jen odstranění) ve stejné transakci jako nabídka.
+    Jen best-effort v SAVEPOINTu - chybějící index (bez pg_trgm / FTS5) nesmí zablokovat uložení nabídky.
+    """
+    if not search_backend(): return False
+    _, key = _search_table()
+    try:
+        with session.begin_nested():
+            session.execute(text(f"DELETE FROM {SEARCH_TABLE} WHERE {key} = :id"), {'id': offer_id})
+            if data is not None:
+                session.execute(text(f"INSERT INTO {SEARCH_TABLE} ({key}, obsah) VALUES (:id, :obsah)"), {'id': offer_id, 'obsah': search_document(zakaznik, data)})
+        return True
+    except Exception as e:
+        logging.warning("Index vyhledávání nebyl aktualizován (nabídka %s): %s", offer_id, e)
+        return False
+
+def rebuild_search_index():
+    """Naplní index vyhledávání z celého archivu (backfill). Vrací počet nabídek."""
+    if not SessionLocal or not search_backend(): return 0
+    session = SessionLocal()
+    try:
+        _, key = _search_table()
+        insert = text(f"INSERT INTO {SEARCH_TABLE} ({key}, obsah) VALUES (:id, :obsah)")
+        session.execute(text(f"DELETE FROM {SEARCH_TABLE}"))
+        stmt = select(Nabidka.id, Nabidka.zakaznik, Nabidka.data_json).execution_options(stream_results=True, yield_per=EXPORT_BATCH_SIZE)
+        count, batch = 0, []
+        for offer_id, zakaznik, data_json in session.execute(stmt):
+            batch.append({'id': offer_id, 'obsah': search_document(zakaznik, json.loads(data_json) if data_json else {})})
+            if len(batch) >= EXPORT_BATCH_SIZE:
+                session.execute(insert, batch)
+                count += len(batch)
+                batch = []
+        if batch: session.execute(insert, batch)
+        session.commit()
+        return count + len(batch)
+    finally: session.close()
+
+def offer_search(query):
+    """Fulltext v archivu (sdílí zobrazení archivu i export). Vrací (zdroj s indexem, podmínky, skóre relevance / None)."""
+    source = Nabidka.__table__
+    tokens = re.findall(r"\w+", normalize_search_text(query))
+    if not tokens: return source, [], None
+    backend = search_backend()
+    if not backend: return source, [Nabidka.zakaznik.ilike(f"%{t}%") for t in tokens], literal(0.0)
+    hledani, key = _search_table()
+    source = source.join(hledani, hledani.c[key] == Nabidka.id)
+    if backend == "postgresql":
+        return source, [literal(t).op('<%')(hledani.c.obsah) for t in tokens], sum(func.word_similarity(t, hledani.c.obsah) for t in tokens)
+    return source, [literal_column(SEARCH_TABLE).op('MATCH')(" ".join(f'"{t}"*' for t in tokens))], -func.bm25(literal_column(SEARCH_TABLE))
+
+def list_offers(query="", page=0, page_size=ARCHIVE_PAGE_SIZE, **filters):
+    """
+    Stránka archivu nabídek. S dotazem -> fulltext (pg_trgm / FTS5) seřazený dle relevance, jinak nejnovější.
+    Vrací (DataFrame, celkový počet).
+    """
+    if not SessionLocal: return pd.DataFrame(), 0
+    source, search_conds, score = offer_search(query)
+    conds = offer_filter_conditions(**filters) + search_conds
+    order = [Nabidka.datum_vytvoreni.desc()]
+    if score is None: score = literal(0.0)
+    else: order.insert(0, score.desc())
+    session = SessionLocal()
+    try:
+        total = session.execute(select(func.count()).select_from(source).where(*conds)).scalar()
+        stmt = (select(Nabidka.id, Nabidka.datum_vytvoreni, Nabidka.zakaznik, Nabidka.model, Nabidka.cena_celkem,
+                       func.coalesce(json_field(Nabidka.data_json, 'vypracoval'), 'Neznámý').label('vypracoval'),
+                       json_field(Nabidka.data_json, 'zak_adresa').label('adresa'), score.label('skore'))
+                .select_from(source).where(*conds).order_by(*order).limit(page_size).offset(page * page_size))
+        return pd.read_sql(stmt, session.bind), total
+    finally: session.close()
+
+def get_sales_rollups(obdobi_typ="M"):
+    if not SessionLocal: return pd.DataFrame()
+    session = SessionLocal()
+    try:
+        q = session.query(ProdejSouhrn.obdobi, ProdejSouhrn.vypracoval, ProdejSouhrn.model, ProdejSouhrn.pocet, ProdejSouhrn.obrat).filter(ProdejSouhrn.obdobi_typ == obdobi_typ, ProdejSouhrn.pocet != 0)
+        return pd.read_sql(q.statement, session.bind)
+    finally: session.close()
+
 def update_priplatek_db(edited_df):
     if not SessionLocal: return
     session = SessionLocal()
@@ -296,11 +569,60 @@ def update_priplatek_db(edited_df):
                 item.cena_pct = float(row['cena_pct']) if row['cena_pct'] is not None else 0.0
                 item.kategorie = row['kategorie']
         session.commit()
-        st.toast("Ceny uloženy! ✅")
     except Exception as e:
         st.error(f"Chyba při ukládání: {e}")
+        return
     finally:
         session.close()
+    st.toast("Ceny uloženy! ✅")
+    try: sync_price_history()
+    except Exception as e: st.warning(f"Ceny jsou uloženy, ale historii cen se nepodařilo dorovnat: {e}")
+
+def _sync_history_table(session, table, hist, ref_col, fields, now):
+    current = {row.id: row for row in session.query(table).all()}
+    open_rows = {getattr(h, ref_col): h for h in session.query(hist).filter(hist.platne_do.is_(None)).all()}
+    # Prázdná historie = první naplnění, stávající ceny platí zpětně
+    valid_from = now if session.query(hist.id).first() else HISTORY_START
+    changed = 0
+    for ref_id, h in open_rows.items():
+        row = current.get(ref_id)
+        if row is None or any(getattr(row, f) != getattr(h, f) for f in fields):
+            h.platne_do = now
+            changed += 1
+    for ref_id, row in current.items():
+        h = open_rows.get(ref_id)
+        if h is None or h.platne_do is not None:
+            session.add(hist(**{ref_col: ref_id, 'platne_od': valid_from}, **{f: getattr(row, f) for f in fields}))
+            if h is None: changed += 1
+    return changed
+
+def sync_price_history(now=None):
+    """Dorovná historii s aktuálním ceníkem (editor, importy i přímé zásahy do DB). Vrací počet změněných položek."""
+    if not SessionLocal: return 0
+    for attempt in range(2):
+        session = SessionLocal()
+        try:
+            # Souběžné starty session: Postgres serializuje zámkem, jinde chrání unikátní index otevřených řádků
+            if session.bind.dialect.name == "postgresql": session.execute(text("SELECT pg_advisory_xact_lock(hashtext('sync_price_history'))"))
+            now_ts = now or datetime.now()
+            changed = _sync_history_table(session, Cenik, CenikHistorie, 'cenik_id', CENIK_FIELDS, now_ts)
+            changed += _sync_history_table(session, Priplatek, PriplatekHistorie, 'priplatek_id', PRIPLATEK_FIELDS, now_ts)
+            session.commit()
+            return changed
+        except IntegrityError:
+            # Jiná session právě dorovnala - znovu načíst stav a porovnat
+            session.rollback()
+            if attempt: raise
+        finally: session.close()
+
+def get_price_snapshot(table, as_of=None):
+    """Ceník (Cenik / Priplatek) jako DataFrame - aktuální, nebo stav k okamžiku as_of."""
+    if not SessionLocal: return pd.DataFrame()
+    session = SessionLocal()
+    try:
+        q, _ = price_query(session, table, as_of)
+        return pd.read_sql(q.statement, session.bind)
+    finally: session.close()
 
 def img_to_base64(img_path):
     current_dir = os.path.dirname(os.path.abspath(__file__))
@@ -451,6 +773,9 @@ def generate_pdf_html(zak_udaje, items, totals, model_name):
         browser.close()
     return pdf_bytes
 
+def reset_archive_page():
+    st.session_state['archive_page'] = 0
+
 def get_val(key, default):
     if 'form_data' in st.session_state and key in st.session_state['form_data']: return st.session_state['form_data'][key]
     return default
@@ -459,6 +784,23 @@ def get_val(key, default):
 # HLAVNÍ LOGIKA APLIKACE
 # =======================
 
+# Historie cen se dorovná jednou za session (změny mimo aplikaci, první naplnění)
+if SessionLocal and not st.session_state.get('price_history_synced'):
+    try:
+        sync_price_history()
+        st.session_state['price_history_synced'] = True
+    except Exception as e: st.error(f"Chyba historie cen: {e}")
+if SessionLocal and not st.session_state.get('sales_rollups_ready'):
+    try:
+        ensure_sales_rollups()
+        st.session_state['sales_rollups_ready'] = True
+    except Exception as e: st.error(f"Chyba souhrnů prodeje: {e}")
+if SessionLocal and not st.session_state.get('search_index_ready'):
+    try:
+        ensure_search_index()
+        st.session_state['search_index_ready'] = True
+    except Exception as e: st.error(f"Chyba indexu vyhledávání: {e}")
+
 with st.sidebar:
     st.title(f"Rentmil v{APP_VERSION.split(' ')[0]}")
     app_mode = st.radio("Sekce:", ["Kalkulátor", "🔧 Admin Mód"])
@@ -539,6 +881,7 @@ if app_mode == "Kalkulátor":
         with c_poly1: poly_celo_male = st.checkbox("Plný poly - MALÉ čelo", value=get_val('poly_celo_male', False))
         with c_poly2: poly_celo_velke = st.checkbox("Plný poly - VELKÉ čelo", value=get_val('poly_celo_velke', False))
         change_color_poly = st.checkbox("Změna barvy polykarbonátu", value=get_val('change_color_poly', False))
+        poly_dle_planu = st.checkbox("Cena poly dle plánu řezání (skutečný odpad)", value=get_val('poly_dle_planu', False))
 
         st.subheader("3. Doplňky")
         with st.expander("Dveře a vstupy", expanded=True):
@@ -586,138 +929,28 @@ if app_mode == "Kalkulátor":
 
     with col_result:
         st.markdown("### 📊 Kalkulace")
-        base_price, height, err = calculate_base_price_db(model, sirka, moduly)
+        price_as_of = None
+        if get_val('datum_nabidky', None):
+            datum_nabidky = datetime.fromisoformat(get_val('datum_nabidky', None))
+            if st.checkbox(f"🕰️ Ceny ke dni nabídky ({datum_nabidky.strftime('%d.%m.%Y')})", value=False): price_as_of = datum_nabidky
+        base_price, height, err = calculate_base_price_db(model, sirka, moduly, price_as_of)
         if err: st.error(err)
         else:
-            items = []
-            items.append({"pol": f"Zastřešení {model}", "det": f"{moduly} seg., Š:{sirka}mm", "cen": base_price})
-            
-            if zvyseni_cm > 0:
-                p_zvyseni = get_surcharge_db("Zvýšení zastřešení", is_rock)
-                def_pct = 0.02 if is_rock else 0.03
-                pct_per_10cm = p_zvyseni['pct'] if p_zvyseni['pct'] > 0 else def_pct
-                steps = zvyseni_cm / 10
-                items.append({"pol": f"Zvýšení o {zvyseni_cm} cm", "det": f"+{pct_per_10cm * steps * 100:.0f}%", "cen": base_price * pct_per_10cm * steps})
-
-            # VOLÁNÍ CHYTRÉ GEOMETRIE
-            roof_a_poly, face_a_large, face_a_small, total_struct_len_m_sum, model_cat = calculate_smart_geometry(model, sirka, height, moduly, celkova_delka)
-            
-            # --- DEBUG VARIABLES ---
-            debug_ext_fix = 0
-            debug_ext_mat = 0
-            debug_ext_rail = 0
-            debug_ext_total = 0
-
-            if diff_len > 10:
-                p_atyp_fix = get_surcharge_db("Prodloužení modulu", is_rock)
-                atyp_fee = p_atyp_fix['fix'] if p_atyp_fix['fix'] > 0 else 3000
-                total_fix_fee = pocet_prod_modulu * atyp_fee
-                debug_ext_fix = total_fix_fee
-                
-                p_var_mat = get_surcharge_db("Prodloužení modulu za metr", is_rock)
-                price_per_m2_material = p_var_mat['fix'] if p_var_mat['fix'] > 0 else 2000
-                
-                # Výpočet materiálu prodloužení podle skupiny modelů
-                avg_struct_len_m = total_struct_len_m_sum / moduly
-                extension_area = avg_struct_len_m * (diff_len / 1000.0) 
-                
-                material_cost = extension_area * price_per_m2_material
-                debug_ext_mat = material_cost
-                
-                rail_cost = 0
-                p_rail_unit = get_surcharge_db("Jeden metr koleje", is_rock)
-                price_rail_std = p_rail_unit['fix'] if p_rail_unit['fix'] > 0 else 220
-                
-                rail_price_used = price_rail_std
-                if pochozi_koleje or obousmerne_koleje:
-                     p_rail_prem = get_surcharge_db("Pochozí kolejnice", is_rock)
-                     price_rail_prem = p_rail_prem['fix'] if p_rail_prem['fix'] > 0 else 330
-                     if pochozi_koleje_zdarma: rail_price_used = 0 
-                     else: rail_price_used = price_rail_prem
-                
-                rail_cost = (diff_len / 1000.0) * 2 * rail_price_used
-                debug_ext_rail = rail_cost
-                
-                total_ext_cost = total_fix_fee + material_cost + rail_cost
-                debug_ext_total = total_ext_cost
-                
-                det_txt = f"+{diff_len} mm"
-                items.append({"pol": f"Prodloužení {pocet_prod_modulu} mod. (ATYP)", "det": det_txt, "cen": total_ext_cost})
-
-            elif diff_len < -10:
-                 p_zkrac = get_surcharge_db("Zkrácení modulu", is_rock)
-                 price_per_mod = p_zkrac['fix'] if p_zkrac['fix'] > 0 else 2000
-                 items.append({"pol": f"Zkrácení zastřešení (Atyp)", "det": f"{moduly} ks x {price_per_mod:,.0f} Kč", "cen": moduly * price_per_mod})
-
-            if "Stříbrný" in barva_typ: items.append({"pol": "BONUS: Stříbrný Elox", "det": "-10%", "cen": base_price * -0.10})
-            elif "RAL" in barva_typ: 
-                p = get_surcharge_db("RAL", is_rock)
-                items.append({"pol": f"RAL {ral_kod}", "det": "", "cen": base_price * (p['pct'] or 0.20)})
-            elif "Bronz" in barva_typ:
-                p = get_surcharge_db("BR elox", is_rock)
-                items.append({"pol": "Bronz Elox", "det": "", "cen": base_price * (p['pct'] or 0.05)})
-            elif "Antracit" in barva_typ:
-                p = get_surcharge_db("antracit elox", is_rock)
-                items.append({"pol": "Antracit Elox", "det": "", "cen": base_price * (p['pct'] or 0.05)})
-
-            p_poly_price = get_surcharge_db("Plný polykarbonát", is_rock)
-            poly_base_price = p_poly_price['fix'] if p_poly_price['fix'] > 10 else 1000
-            
-            if poly_strecha: 
-                # Cena se nyní počítá z CHYTRÉ plochy (různá pro BOX/HIGH/ARCH)
-                cost_poly_roof = roof_a_poly * poly_base_price * 1.1
-                items.append({"pol": "Plný poly (Střecha)", "det": f"{roof_a_poly:.1f} m² (Geo: {model_cat})", "cen": cost_poly_roof})
-            
-            if poly_celo_male and not bez_maleho_cela: items.append({"pol": "Plný poly (M. čelo)", "det": f"{face_a_small:.1f} m²", "cen": face_a_small * poly_base_price})
-            if poly_celo_velke and not bez_velkeho_cela: items.append({"pol": "Plný poly (V. čelo)", "det": f"{face_a_large:.1f} m²", "cen": face_a_large * poly_base_price})
-            
-            if change_color_poly:
-                 p = get_surcharge_db("barvy poly", is_rock)
-                 items.append({"pol": "Změna barvy poly", "det": "", "cen": base_price * (p['pct'] or 0.07)})
-
-            p_vc = get_surcharge_db("Jednokřídlé dveře", is_rock)['fix'] or 5000
-            p_bok = get_surcharge_db("boční vstup", is_rock)['fix'] or 7000
-            doors = []
-            for _ in range(pocet_dvere_vc): doors.append(("Dveře VČ", p_vc))
-            for _ in range(pocet_dvere_bok): doors.append(("Boční vstup", p_bok))
-            if doors:
-                doors.sort(key=lambda x: x[1], reverse=True)
-                items.append({"pol": f"{doors[0][0]} (1. ks)", "det": "ZDARMA", "cen": 0})
-                for d in doors[1:]: items.append({"pol": d[0], "det": "", "cen": d[1]})
-
-            if zamykaci_klika and len(doors) > 0:
-                 p = get_surcharge_db("Uzamykání dveří", is_rock)['fix'] or 800
-                 items.append({"pol": "Zamykací klika", "det": f"{len(doors)} ks", "cen": len(doors) * p})
-            if uzamykani_segmentu: items.append({"pol": "Uzamykání segmentů", "det": "", "cen": 1500})
-            if klapka: 
-                p = get_surcharge_db("klapka", is_rock)['fix'] or 7000
-                items.append({"pol": "Větrací klapka", "det": "", "cen": p})
-            if vyklopne_celo: items.append({"pol": "Výklopné čelo", "det": "", "cen": 5000})
-
-            if pochozi_koleje: items.append({"pol": "Pochozí koleje", "det": "", "cen": 0})
-            if obousmerne_koleje:
-                rail_len = (celkova_delka / 1000.0) * 2
-                if pochozi_koleje_zdarma: items.append({"pol": "Obousměrné koleje", "det": "AKCE", "cen": 0})
-                else:
-                    p = get_surcharge_db("Pochozí kolejnice", is_rock)['fix'] or 330
-                    items.append({"pol": "Obousměrné koleje", "det": f"{rail_len:.1f} m", "cen": rail_len * p})
-            if ext_draha_m > 0:
-                 p = get_surcharge_db("Jeden metr koleje", is_rock)['fix'] or 220
-                 items.append({"pol": "Prodloužení dráhy", "det": f"{ext_draha_m} m", "cen": ext_draha_m * p})
-            if podhori:
-                 p = get_surcharge_db("podhorskou", is_rock)
-                 items.append({"pol": "Zpevnění Podhoří", "det": "15%", "cen": base_price * (p['pct'] or 0.15)})
-
-            mat_sum = sum(x['cen'] for x in items)
-            if montaz:
-                 p = get_surcharge_db("Montáž zastřešení v ČR", is_rock)
-                 pct = p['pct'] if p['pct'] > 0 else 0.08
-                 items.append({"pol": "Montáž", "det": f"{pct*100:.0f}%", "cen": mat_sum * pct})
-            if sleva_pct > 0: items.append({"pol": "SLEVA", "det": f"-{sleva_pct}%", "cen": -mat_sum * (sleva_pct/100.0)})
-            if km > 0: items.append({"pol": "Doprava", "det": f"{km} km", "cen": km * cena_za_km})
-
-            total_no_vat = sum(i['cen'] for i in items)
-            total_vat = total_no_vat * (1 + dph_sazba/100.0)
+            offer_inputs = {
+                'zak_adresa': zak_adresa, 'zak_tel': zak_tel, 'zak_email': zak_email, 'termin_dodani': termin_dodani, 'platnost_dny': platnost_dny,
+                'model': model, 'moduly': moduly, 'sirka': sirka, 'celkova_delka': celkova_delka, 'pocet_prod_modulu': pocet_prod_modulu, 'zvyseni_cm': zvyseni_cm,
+                'barva_typ': barva_typ, 'ral_kod': ral_kod, 'poly_strecha': poly_strecha, 'poly_celo_male': poly_celo_male, 'poly_celo_velke': poly_celo_velke,
+                'change_color_poly': change_color_poly, 'poly_dle_planu': poly_dle_planu, 'pocet_dvere_vc': pocet_dvere_vc, 'pocet_dvere_bok': pocet_dvere_bok,
+                'zamykaci_klika': zamykaci_klika, 'uzamykani_segmentu': uzamykani_segmentu, 'klapka': klapka,
+                'bez_maleho_cela': bez_maleho_cela, 'bez_velkeho_cela': bez_velkeho_cela, 'vyklopne_celo': vyklopne_celo,
+                'pochozi_koleje': pochozi_koleje, 'pochozi_koleje_zdarma': pochozi_koleje_zdarma, 'obousmerne_koleje': obousmerne_koleje,
+                'ext_draha_m': ext_draha_m, 'podhori': podhori, 'km': km, 'cena_za_km': cena_za_km, 'montaz': montaz, 'sleva_pct': sleva_pct, 'dph_sazba': dph_sazba,
+            }
+            if pocet_dvere_vc > 0: offer_inputs['dvere_vc_sirka'] = dvere_vc_sirka
+            items, totals, calc_info = calculate_offer_items(offer_inputs, base_price, height, lambda term, rock: get_surcharge_db(term, rock, price_as_of))
+            total_no_vat, total_vat = totals['bez_dph'], totals['s_dph']
+            cut_plans = calc_info['cut_plans']
+            if calc_info['cut_plan_error']: st.warning(f"Plán řezání: {calc_info['cut_plan_error']}")
 
             df_res = pd.DataFrame(items)
             if not df_res.empty: st.dataframe(df_res[['pol', 'det', 'cen']].style.format({"cen": "{:,.0f}"}), hide_index=True, use_container_width=True)
@@ -726,18 +959,34 @@ if app_mode == "Kalkulátor":
             with st.expander("🔍 Detailní rozpad ceny (Debug Mode)", expanded=True):
                 st.markdown(f"""
                 <div class='debug-box'>
-                <strong>Prodloužení ({diff_len:.0f} mm):</strong><br>
-                1. Fixní poplatek: {pocet_prod_modulu} x {atyp_fee} = <b>{debug_ext_fix:,.0f} Kč</b><br>
-                2. Materiál (Plocha: {extension_area:.2f} m²): {debug_ext_mat:,.0f} Kč<br>
-                3. Koleje: {debug_ext_rail:,.0f} Kč<br>
-                <strong>CELKEM PRODLOUŽENÍ: {debug_ext_total:,.0f} Kč</strong><br><br>
+                <strong>Prodloužení ({calc_info['diff_len']:.0f} mm):</strong><br>
+                1. Fixní poplatek: {calc_info['pocet_prod_modulu']} x {calc_info['atyp_fee']} = <b>{calc_info['debug_ext_fix']:,.0f} Kč</b><br>
+                2. Materiál (Plocha: {calc_info['extension_area']:.2f} m²): {calc_info['debug_ext_mat']:,.0f} Kč<br>
+                3. Koleje: {calc_info['debug_ext_rail']:,.0f} Kč<br>
+                <strong>CELKEM PRODLOUŽENÍ: {calc_info['debug_ext_total']:,.0f} Kč</strong><br><br>
                 <strong>Polykarbonát:</strong><br>
-                Kategorie: {model_cat}<br>
-                Plocha střechy: {roof_a_poly:.2f} m² (vč. korekce)
+                Kategorie: {calc_info['model_cat']}<br>
+                Plocha střechy: {calc_info['roof_a_poly']:.2f} m² (vč. korekce)
                 </div>
                 """, unsafe_allow_html=True)
             # ---------------------
 
+            if cut_plans:
+                with st.expander("✂️ Plán řezání polykarbonátu"):
+                    for material, cut_plan in cut_plans.items():
+                        st.markdown(f"**{POLY_MATERIALS[material]}**")
+                        c_cp1, c_cp2, c_cp3 = st.columns(3)
+                        c_cp1.metric("Desky", f"{cut_plan['pocet_desek']} ks", delta=f"{cut_plan['deska'][0]}x{cut_plan['deska'][1]} mm", delta_color="off")
+                        c_cp2.metric("Plocha dílů", f"{cut_plan['plocha_dilu_m2']:.1f} m²", delta=f"desky {cut_plan['plocha_desek_m2']:.1f} m²", delta_color="off")
+                        c_cp3.metric("Odpad", f"{cut_plan['odpad_pct']:.0f} %", delta=f"{cut_plan['odpad_m2']:.1f} m²", delta_color="off")
+                        df_cut = pd.DataFrame([{'deska': idx + 1, 'nazev': d['nazev'], 'dil': d['dil'], 'x': d['x'], 'y': d['y'], 'x2': d['x'] + d['w'], 'y2': d['y'] + d['h']}
+                                               for idx, desk in enumerate(cut_plan['desky']) for d in desk])
+                        st.altair_chart(alt.Chart(df_cut).mark_rect(stroke='black', opacity=0.7).encode(
+                            x=alt.X('x:Q', scale=alt.Scale(domain=[0, cut_plan['deska'][0]]), title=None), x2='x2',
+                            y=alt.Y('y:Q', scale=alt.Scale(domain=[0, cut_plan['deska'][1]]), title=None), y2='y2',
+                            color='dil', tooltip=['nazev', 'deska']).properties(width=120, height=120 * cut_plan['deska'][1] / cut_plan['deska'][0]).facet(facet='deska:N', columns=6))
+                        st.caption(f"Výpočet {cut_plan['cas_ms']:.0f} ms")
+
             st.divider()
             st.metric("Cena CELKEM", f"{total_vat:,.0f} Kč", delta=f"Bez DPH: {total_no_vat:,.0f}")
 
@@ -745,14 +994,17 @@ if app_mode == "Kalkulátor":
             with c_btn1:
                 if zak_jmeno:
                     zak_udaje = {'jmeno': zak_jmeno, 'adresa': zak_adresa, 'tel': zak_tel, 'email': zak_email, 'vypracoval': vypracoval, 'datum': datum_vystaveni.strftime("%d.%m.%Y"), 'platnost': platnost_do.strftime("%d.%m.%Y"), 'termin': termin_dodani, 'zvyseni_cm': zvyseni_cm}
-                    totals = {'bez_dph': total_no_vat, 'dph': total_vat-total_no_vat, 's_dph': total_vat, 'sazba_dph': dph_sazba}
                     pdf_data = generate_pdf_html(zak_udaje, items, totals, model)
                     st.download_button("📄 PDF", data=pdf_data, file_name=f"Nabidka_{zak_jmeno}.pdf", mime="application/pdf", type="primary", use_container_width=True)
             with c_btn2:
                 if zak_jmeno:
                     if st.button("💾 Uložit", use_container_width=True):
                         save_data = st.session_state.get('form_data', {}).copy()
+                        save_data.pop('datum_nabidky', None)
                         save_data.update({'zak_jmeno': zak_jmeno, 'model': model, 'vypracoval': vypracoval, 'zvyseni_cm': zvyseni_cm})
+                        # Všechny vstupy kalkulace + položky - pro opakovaný výpočet, plán řezání a exporty z archivu
+                        save_data.update(offer_inputs)
+                        save_data.update({'vyska_mm': height, 'cena_bez_dph': total_no_vat, 'polozky': items})
                         success, msg = save_offer_to_db(save_data, total_vat)
                         if success: st.success("OK")
                         else: st.error(msg)
@@ -762,27 +1014,43 @@ elif app_mode == "🔧 Admin Mód":
         st.warning("Pro přístup se přihlašte v levém panelu.")
     else:
         st.title("🔐 Administrace")
-        session = SessionLocal()
-        df_nabidky = pd.read_sql(session.query(Nabidka).statement, session.bind) if SessionLocal else pd.DataFrame()
-        session.close()
         
         st.subheader("1. Přehled Prodeje")
-        if not df_nabidky.empty:
-            if 'vypracoval' not in df_nabidky.columns:
-                df_nabidky['vypracoval'] = df_nabidky['data_json'].apply(lambda x: json.loads(x).get('vypracoval', 'Neznámý') if x else 'Neznámý')
+        df_souhrn = get_sales_rollups("M")
+        if not df_souhrn.empty:
             kpi1, kpi2, kpi3 = st.columns(3)
-            kpi1.metric("Celkový obrat", f"{df_nabidky['cena_celkem'].sum():,.0f} Kč")
-            kpi2.metric("Počet nabídek", len(df_nabidky))
-            kpi3.metric("Průměrná nabídka", f"{df_nabidky['cena_celkem'].mean():,.0f} Kč")
+            total_obrat, total_pocet = df_souhrn['obrat'].sum(), df_souhrn['pocet'].sum()
+            kpi1.metric("Celkový obrat", f"{total_obrat:,.0f} Kč")
+            kpi2.metric("Počet nabídek", int(total_pocet))
+            kpi3.metric("Průměrná nabídka", f"{(total_obrat / total_pocet if total_pocet else 0):,.0f} Kč")
             st.divider()
             g1, g2 = st.columns(2)
             with g1:
                 st.markdown("#### Top Obchodníci")
-                st.altair_chart(alt.Chart(df_nabidky.groupby('vypracoval')['cena_celkem'].sum().reset_index()).mark_bar().encode(x=alt.X('vypracoval', sort='-y'), y='cena_celkem', color='vypracoval'), use_container_width=True)
+                st.altair_chart(alt.Chart(df_souhrn.groupby('vypracoval')['obrat'].sum().reset_index().rename(columns={'obrat': 'cena_celkem'})).mark_bar().encode(x=alt.X('vypracoval', sort='-y'), y='cena_celkem', color='vypracoval'), use_container_width=True)
             with g2:
                 st.markdown("#### Oblíbené Modely")
-                st.altair_chart(alt.Chart(df_nabidky['model'].value_counts().reset_index().set_axis(['model', 'pocet'], axis=1)).mark_arc().encode(theta='pocet', color='model', tooltip=['model', 'pocet']), use_container_width=True)
-        else: st.info("Žádná data.")
+                st.altair_chart(alt.Chart(df_souhrn.groupby('model')['pocet'].sum().reset_index()).mark_arc().encode(theta='pocet', color='model', tooltip=['model', 'pocet']), use_container_width=True)
+
+            st.markdown("#### Vývoj Prodeje")
+            c_t1, c_t2, c_t3 = st.columns(3)
+            with c_t1: trend_obdobi = st.radio("Období", ["Měsíčně", "Týdně"], horizontal=True)
+            with c_t2: trend_dim = st.radio("Členění", ["Obchodník", "Model"], horizontal=True)
+            with c_t3: trend_metrika = st.radio("Ukazatel", ["Obrat", "Počet", "Průměr"], horizontal=True)
+            df_trend = df_souhrn if trend_obdobi == "Měsíčně" else get_sales_rollups("W")
+            dim_col = 'vypracoval' if trend_dim == "Obchodník" else 'model'
+            df_trend = df_trend.groupby(['obdobi', dim_col])[['pocet', 'obrat']].sum().reset_index()
+            df_trend['prumer'] = df_trend['obrat'] / df_trend['pocet'].where(df_trend['pocet'] != 0)
+            y_col = {"Obrat": 'obrat', "Počet": 'pocet', "Průměr": 'prumer'}[trend_metrika]
+            st.altair_chart(alt.Chart(df_trend).mark_line(point=True).encode(x=alt.X('obdobi:T', title=None), y=alt.Y(f'{y_col}:Q', title=trend_metrika), color=dim_col, tooltip=['obdobi:T', dim_col, 'pocet', alt.Tooltip('obrat', format=',.0f')]), use_container_width=True)
+
+            st.markdown("#### Podíl Modelů podle Obchodníka")
+            df_mix = df_souhrn.groupby(['vypracoval', 'model'])['pocet'].sum().reset_index()
+            st.altair_chart(alt.Chart(df_mix).mark_bar().encode(x=alt.X('sum(pocet):Q', stack='normalize', title='Podíl nabídek'), y=alt.Y('vypracoval', title=None), color='model', tooltip=['vypracoval', 'model', 'pocet']), use_container_width=True)
+        else: st.info("Žádná data. Pokud archiv už nabídky obsahuje, přepočítejte souhrny.")
+        if st.button("🔄 Přepočítat souhrny z archivu"):
+            st.toast(f"Souhrny přepočítány ({rebuild_sales_rollups()} řádků).")
+            st.rerun()
 
         st.divider()
         st.subheader("2. Správa Ceníků")
@@ -792,7 +1060,32 @@ elif app_mode == "🔧 Admin Mód":
         if not df_priplatky.empty:
             edited_df = st.data_editor(df_priplatky[['id', 'nazev', 'cena_fix', 'cena_pct', 'kategorie']], key="editor_priplatky", disabled=["id"], hide_index=True, use_container_width=True)
             if st.button("💾 Uložit ceny"): update_priplatek_db(edited_df)
+
+        with st.expander("🕰️ Historie ceníků"):
+            c_h1, c_h2, c_h3 = st.columns([1, 1, 1])
+            with c_h1: hist_date = st.date_input("Stav ke dni", value=date.today())
+            with c_h2: hist_time = st.time_input("Čas", value=datetime.max.time())
+            with c_h3:
+                st.write("")
+                if st.button("🔄 Dorovnat historii"):
+                    st.toast(f"Změněno položek: {sync_price_history()}")
+            hist_as_of = datetime.combine(hist_date, hist_time)
+            h1, h2 = st.tabs(["Příplatky", "Modely"])
+            with h1: st.dataframe(get_price_snapshot(Priplatek, hist_as_of), hide_index=True, use_container_width=True)
+            with h2: st.dataframe(get_price_snapshot(Cenik, hist_as_of), hide_index=True, use_container_width=True)
         
+        with st.expander("✂️ Plán řezání - celý archiv"):
+            if st.button("Spočítat plány řezání"):
+                df_cut_archive = cutting_plan_archive()
+                if df_cut_archive.empty: st.info("Žádné nabídky s uloženými rozměry.")
+                else:
+                    c_ca1, c_ca2, c_ca3 = st.columns(3)
+                    c_ca1.metric("Desky celkem", f"{df_cut_archive['pocet_desek'].sum():,.0f} ks")
+                    c_ca2.metric("Průměrný odpad", f"{(1 - df_cut_archive['plocha_dilu_m2'].sum() / df_cut_archive['plocha_desek_m2'].sum()) * 100:.1f} %")
+                    c_ca3.metric("Průměrný čas / nabídka", f"{df_cut_archive.groupby('id')['cas_ms'].sum().mean():.1f} ms")
+                    st.dataframe(df_cut_archive.groupby(['model', 'material'])[['pocet_desek', 'plocha_dilu_m2', 'plocha_desek_m2']].sum().assign(odpad_pct=lambda d: (1 - d['plocha_dilu_m2'] / d['plocha_desek_m2']) * 100).style.format("{:,.1f}"), use_container_width=True)
+                    st.download_button("📥 Plány řezání (CSV)", data=df_cut_archive.to_csv(index=False).encode('utf-8'), file_name="plany_rezani.csv", mime="text/csv")
+
         with st.expander("📂 Hromadné nahrávání CSV"):
             t1, t2 = st.tabs(["Modely", "Příplatky"])
             with t1:
@@ -803,8 +1096,57 @@ elif app_mode == "🔧 Admin Mód":
 
         st.divider()
         st.subheader("3. Archiv Nabídek")
+        hledat = st.text_input("🔎 Hledat zákazníka", placeholder="jméno, adresa, telefon nebo email", on_change=reset_archive_page)
+        c_f1, c_f2, c_f3, c_f4 = st.columns(4)
+        with c_f1: f_obdobi = st.date_input("Období", value=(), format="DD.MM.YYYY", on_change=reset_archive_page)
+        with c_f2: f_modely = st.multiselect("Model", [m for m in MODEL_PARAMS.keys() if m != "DEFAULT"], on_change=reset_archive_page)
+        with c_f3: f_vypracovali = st.multiselect("Obchodník", sorted(df_souhrn['vypracoval'].unique()) if not df_souhrn.empty else [], on_change=reset_archive_page)
+        with c_f4: f_zakaznik = st.text_input("Zákazník obsahuje", on_change=reset_archive_page)
+        archive_filters = {'datum_od': f_obdobi[0] if len(f_obdobi) > 0 else None, 'datum_do': f_obdobi[1] if len(f_obdobi) > 1 else None,
+                           'modely': f_modely, 'zakaznik': f_zakaznik, 'vypracovali': f_vypracovali}
+
+        archive_page = st.session_state.get('archive_page', 0)
+        df_nabidky, archive_total = list_offers(hledat, archive_page, **archive_filters)
+        archive_pages = max(1, math.ceil(archive_total / ARCHIVE_PAGE_SIZE))
+        if archive_page >= archive_pages:
+            archive_page = st.session_state['archive_page'] = 0
+            df_nabidky, archive_total = list_offers(hledat, 0, **archive_filters)
+
+        with st.expander("📤 Export archivu (dle filtrů)"):
+            c_e1, c_e2 = st.columns(2)
+            with c_e1: exp_fmt = st.radio("Formát", ["CSV", "XLSX"], horizontal=True)
+            with c_e2:
+                if st.button("Připravit export"):
+                    suffix = exp_fmt.lower()
+                    old_export = st.session_state.pop('export_file', None)
+                    if old_export and os.path.exists(old_export[0]): os.remove(old_export[0])
+                    cleanup_exports()
+                    os.makedirs(EXPORT_DIR, exist_ok=True)
+                    try:
+                        with tempfile.NamedTemporaryFile(suffix=f".{suffix}", dir=EXPORT_DIR, delete=False) as tmp:
+                            count = export_offers(tmp, suffix, hledat, **archive_filters)
+                        st.session_state['export_file'] = (tmp.name, f"nabidky_{date.today():%Y%m%d}.{suffix}", count)
+                    except ImportError:
+                        os.remove(tmp.name)
+                        st.error("Chybí knihovna openpyxl. XLSX export nebude fungovat.")
+            if 'export_file' in st.session_state and os.path.exists(st.session_state['export_file'][0]):
+                exp_path, exp_name, exp_count = st.session_state['export_file']
+                exp_mime = "text/csv" if exp_name.endswith(".csv") else "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+                # Soubor se načte do paměti až při kliknutí (ne při každém rerunu), smaže ho cleanup_exports
+                st.download_button(f"📥 Stáhnout {exp_name} ({exp_count} nabídek)", data=lambda: read_export(exp_path), file_name=exp_name, mime=exp_mime)
+
         if not df_nabidky.empty:
-            st.dataframe(df_nabidky[['id', 'datum_vytvoreni', 'zakaznik', 'model', 'cena_celkem', 'vypracoval']], use_container_width=True)
+            st.dataframe(df_nabidky[['id', 'datum_vytvoreni', 'zakaznik', 'adresa', 'model', 'cena_celkem', 'vypracoval']], hide_index=True, use_container_width=True)
+            c_pg1, c_pg2, c_pg3 = st.columns([1, 2, 1])
+            with c_pg1:
+                if st.button("◀ Předchozí", disabled=archive_page == 0):
+                    st.session_state['archive_page'] = archive_page - 1
+                    st.rerun()
+            with c_pg2: st.caption(f"Strana {archive_page + 1} / {archive_pages} · nalezeno {archive_total} nabídek")
+            with c_pg3:
+                if st.button("Další ▶", disabled=archive_page + 1 >= archive_pages):
+                    st.session_state['archive_page'] = archive_page + 1
+                    st.rerun()
             col_sel, col_load, col_del = st.columns([2, 1, 1])
             with col_sel: del_id = st.selectbox("Vyber ID:", df_nabidky['id'])
             with col_load:
@@ -815,9 +1157,13 @@ elif app_mode == "🔧 Admin Mód":
                         db_offer = session.query(Nabidka).filter(Nabidka.id == int(del_id)).first()
                         if db_offer:
                             st.session_state['form_data'] = json.loads(db_offer.data_json)
+                            st.session_state['form_data']['datum_nabidky'] = db_offer.datum_vytvoreni.isoformat()
                             st.toast("Načteno!", icon="✅")
                         session.close()
             with col_del:
                 if st.button("🗑️ Smazat"):
                     delete_offer(del_id)
                     st.rerun()
+        elif hledat: st.info("Nic nenalezeno.")
+        if search_backend() and st.button("🔄 Přestavět index vyhledávání"):
+            st.toast(f"Zaindexováno nabídek: {rebuild_search_index()}")
@@ -0,0 +1,148 @@
+"""
+Plán řezání polykarbonátu.
+Díly zastřešení (pásy střechy, polotovary čel) se rozmístí na standardní desky
+heuristikou MaxRects (Best Short Side Fit) s otáčením dílů. Zkouší se pevná sada
+velikostí desek, orientací dělení a pořadí dílů, vrací se plán s nejmenší plochou desek.
+Výsledek je deterministický (nezávisí na rychlosti stroje) - plán vstupuje do ceny.
+"""
+import time
+from itertools import product
+
+# --- STANDARDNÍ DESKY (šířka x délka v mm) ---
+POLY_SHEET_SIZES = [(2050, 3050), (2050, 6000), (2100, 7000)]
+CUT_KERF_MM = 4
+
+# Pořadí dílů zkoušená při optimalizaci
+SORT_KEYS = [
+    lambda p: p['w'] * p['h'],
+    lambda p: max(p['w'], p['h']),
+    lambda p: p['w'] + p['h'],
+    lambda p: min(p['w'], p['h']),
+]
+
+def make_piece(dil, nazev, w, h, net_m2=None):
+    """Obdélníkový polotovar. net_m2 = skutečná plocha dílu (např. kruhová úseč čela), jinak w*h."""
+    return {'dil': dil, 'nazev': nazev, 'w': float(w), 'h': float(h), 'net_m2': net_m2 if net_m2 is not None else (w * h) / 1_000_000}
+
+def _split_lengths(length, limit, overlap_mm):
+    """Rozdělení délky na celé pásy desky + zbytek (spoje s přesahem)."""
+    if length <= limit: return [length]
+    if limit <= overlap_mm: return None
+    lengths = []
+    while length > limit:
+        lengths.append(limit)
+        length -= limit - overlap_mm
+    return lengths + [length]
+
+def split_piece(piece, sheet_w, sheet_h, overlap_mm=0, orientation=None):
+    """
+    Díl větší než deska rozdělí na pásy (s přesahem ve spoji), aby se vešly na desku.
+    orientation: 0 = šířka dílu podél šířky desky, 1 = podél délky desky, None = menší počet pásů.
+    """
+    w, h = piece['w'], piece['h']
+    if (w <= sheet_w and h <= sheet_h) or (w <= sheet_h and h <= sheet_w): return [piece]
+
+    options = []
+    for mode, (lim_w, lim_h) in enumerate(((sheet_w, sheet_h), (sheet_h, sheet_w))):
+        if orientation is not None and mode != orientation: continue
+        lens_w, lens_h = _split_lengths(w, lim_w, overlap_mm), _split_lengths(h, lim_h, overlap_mm)
+        if lens_w and lens_h: options.append((len(lens_w) * len(lens_h), lens_w, lens_h))
+    if not options: raise ValueError(f"Díl {piece['nazev']} nelze rozdělit na desku {sheet_w}x{sheet_h} mm")
+
+    _, lens_w, lens_h = min(options, key=lambda o: o[0])
+    total_area = sum(lens_w) * sum(lens_h)
+    count = len(lens_w) * len(lens_h)
+    return [make_piece(piece['dil'], f"{piece['nazev']} ({i * len(lens_h) + j + 1}/{count})", pw, ph, piece['net_m2'] * pw * ph / total_area)
+            for i, pw in enumerate(lens_w) for j, ph in enumerate(lens_h)]
+
+def _find_position(free_rects, w, h):
+    best = None
+    for fx, fy, fw, fh in free_rects:
+        for pw, ph, rotated in ((w, h, False), (h, w, True)):
+            if pw <= fw and ph <= fh:
+                score = (min(fw - pw, fh - ph), max(fw - pw, fh - ph))
+                if best is None or score < best[0]: best = (score, (fx, fy, pw, ph, rotated))
+    return best
+
+def _place(free_rects, x, y, w, h):
+    new_free = []
+    for fx, fy, fw, fh in free_rects:
+        if x >= fx + fw or x + w <= fx or y >= fy + fh or y + h <= fy:
+            new_free.append((fx, fy, fw, fh))
+            continue
+        if x > fx: new_free.append((fx, fy, x - fx, fh))
+        if x + w < fx + fw: new_free.append((x + w, fy, fx + fw - x - w, fh))
+        if y > fy: new_free.append((fx, fy, fw, y - fy))
+        if y + h < fy + fh: new_free.append((fx, y + h, fw, fy + fh - y - h))
+    # Odstranění volných obdélníků obsažených v jiných
+    pruned = []
+    for i, a in enumerate(new_free):
+        contained = False
+        for j, b in enumerate(new_free):
+            if i != j and a[0] >= b[0] and a[1] >= b[1] and a[0] + a[2] <= b[0] + b[2] and a[1] + a[3] <= b[1] + b[3]:
+                if a != b or i > j:
+                    contained = True
+                    break
+        if not contained: pruned.append(a)
+    return pruned
+
+def pack_pieces(pieces, sheet_w, sheet_h, kerf_mm=CUT_KERF_MM):
+    """MaxRects BSSF přes všechny otevřené desky. Vrací seznam desek [{'free': [...], 'dily': [...]}]."""
+    sheets = []
+    for p in pieces:
+        w, h = p['w'] + kerf_mm, p['h'] + kerf_mm
+        best = None
+        for idx, sheet in enumerate(sheets):
+            pos = _find_position(sheet['free'], w, h)
+            if pos and (best is None or pos[0] < best[0]): best = (pos[0], idx, pos[1])
+        if best is None:
+            # Prořez za posledním dílem u hrany desky není potřeba
+            sheets.append({'free': [(0, 0, sheet_w + kerf_mm, sheet_h + kerf_mm)], 'dily': []})
+            pos = _find_position(sheets[-1]['free'], w, h)
+            if pos is None: raise ValueError(f"Díl {p['nazev']} se nevejde na desku {sheet_w}x{sheet_h} mm")
+            best = (pos[0], len(sheets) - 1, pos[1])
+        _, idx, (x, y, pw, ph, rotated) = best
+        sheet = sheets[idx]
+        sheet['free'] = _place(sheet['free'], x, y, pw, ph)
+        sheet['dily'].append({'dil': p['dil'], 'nazev': p['nazev'], 'x': x, 'y': y, 'w': pw - kerf_mm, 'h': ph - kerf_mm, 'otoceno': rotated, 'net_m2': p['net_m2']})
+    return sheets
+
+def optimize_cutting_plan(pieces, sheet_sizes=None, overlap_mm=0, kerf_mm=CUT_KERF_MM, time_budget_s=None):
+    """
+    Najde plán řezání s nejmenší plochou desek prohledáním všech kombinací (velikost desky x orientace x pořadí).
+    time_budget_s = volitelné přerušení pro průzkumné dávky (první pokus se dokončí vždy) - nikdy pro plán, ze kterého se počítá cena.
+    Vrací dict: deska, pocet_desek, plocha_desek_m2, plocha_dilu_m2, odpad_m2, odpad_pct, dily (brutto/netto po dílech), desky, cas_ms.
+    """
+    if not pieces: return None
+    start = time.perf_counter()
+    best = None
+    for (sheet_w, sheet_h), orientation, sort_key in product(sheet_sizes or POLY_SHEET_SIZES, (None, 0, 1), SORT_KEYS):
+        if time_budget_s is not None and best is not None and time.perf_counter() - start > time_budget_s: break
+        try: split = [s for p in pieces for s in split_piece(p, sheet_w, sheet_h, overlap_mm, orientation)]
+        except ValueError: continue
+        sheets = pack_pieces(sorted(split, key=sort_key, reverse=True), sheet_w, sheet_h, kerf_mm)
+        score = (len(sheets) * sheet_w * sheet_h, len(sheets))
+        if best is None or score < best[0]: best = (score, (sheet_w, sheet_h), sheets)
+    if best is None: raise ValueError("Žádná velikost desky nevyhovuje dílům")
+
+    _, (sheet_w, sheet_h), sheets = best
+    sheet_area = len(sheets) * sheet_w * sheet_h / 1_000_000
+    net_area = sum(p['net_m2'] for p in pieces)
+    # Skutečný odpad se rozpočítá na díly poměrem čisté plochy
+    gross_coef = sheet_area / net_area if net_area > 0 else 0
+    parts = {}
+    for p in pieces:
+        part = parts.setdefault(p['dil'], {'netto_m2': 0.0, 'brutto_m2': 0.0})
+        part['netto_m2'] += p['net_m2']
+        part['brutto_m2'] += p['net_m2'] * gross_coef
+    return {
+        'deska': (sheet_w, sheet_h),
+        'pocet_desek': len(sheets),
+        'plocha_desek_m2': sheet_area,
+        'plocha_dilu_m2': net_area,
+        'odpad_m2': sheet_area - net_area,
+        'odpad_pct': (sheet_area - net_area) / sheet_area * 100 if sheet_area > 0 else 0,
+        'dily': parts,
+        'desky': [s['dily'] for s in sheets],
+        'cas_ms': (time.perf_counter() - start) * 1000,
+    }
@@ -0,0 +1,323 @@
+"""
+Zátěžový test kalkulátoru - souběžní obchodníci nad lokální databází.
+Každý simulovaný obchodník má vlastní session (streamlit.testing AppTest) ve stejném procesu jako skutečný
+Streamlit server: vyplní zákazníka (od té chvíle se při každém rerunu generuje PDF), hýbe moduly, šířkou
+a délkou, přepíná volby a ukládá nabídky. Pro každou úroveň souběhu se měří latence rerunů, spojení do DB,
+počet procesů Chromia a špička paměti (aplikace + Chromium).
+
+Použití:
+    python loadtest.py [--urovne 1,2,5,10] [--akce 20] [--pauza 0] [--limit-ms 2000] [--db URL] [--out zatez]
+
+Bez --db a DATABASE_URL se použije dočasná SQLite s demo ceníkem. Nabídky se opravdu ukládají - spouštět
+jen proti lokální kopii DB (Postgres nebo SQLite), nikdy proti produkci.
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter
+
+import pandas as pd
+from sqlalchemy import create_engine, event, text
+from sqlalchemy.pool import Pool
+from streamlit import config
+from streamlit.runtime.runtime import Runtime
+from streamlit.runtime.scriptrunner.script_cache import ScriptCache
+from streamlit.testing.v1 import AppTest, local_script_runner
+
+from pricing import MODEL_PARAMS
+
+APP_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "app.py")
+PRIPLATKY_CSV = os.path.join(os.path.dirname(os.path.abspath(__file__)), "priplatky.csv")
+RERUN_TIMEOUT_S = 300
+SAMPLE_INTERVAL_S = 0.05
+PERCENTILES = [0.5, 0.9, 0.95, 0.99]
+
+# Akce obchodníka a jejich relativní četnost
+ACTION_WEIGHTS = {'moduly': 3, 'sirka': 2, 'delka': 2, 'volba': 4, 'ulozit': 1}
+TOGGLE_OPTIONS = ["Plný poly - STŘECHA", "Plný poly - MALÉ čelo", "Plný poly - VELKÉ čelo", "Změna barvy polykarbonátu",
+                  "Cena poly dle plánu řezání (skutečný odpad)", "Zamykací klika", "Uzamykání segmentů", "Větrací klapka",
+                  "Pochozí koleje", "Obousměrné koleje", "Montáž"]
+
+# Streamlit server sdílí jednu ScriptCache pro všechny session, AppTest kompiluje skript při každém rerunu
+# (zkreslená latence, souběžný ast.parse ve vláknech padá) - stejné chování jako server
+_script_cache = ScriptCache()
+local_script_runner.ScriptCache = lambda: _script_cache
+
+# AppTest při každém rerunu nastaví a po něm zruší globální Runtime._instance - souběžné session ve vláknech
+# si ho navzájem rušily ("Runtime hasn't been created!"). Server má jeden Runtime pro všechny session:
+# po zrušení se dál používá naposledy nastavený.
+_last_runtime = None
+_runtime_instance = Runtime.instance.__func__
+
+def _shared_runtime_instance(cls):
+    global _last_runtime
+    if cls._instance is not None: _last_runtime = cls._instance
+    return _last_runtime if _last_runtime is not None else _runtime_instance(cls)
+
+Runtime.instance = classmethod(_shared_runtime_instance)
+Runtime.exists = classmethod(lambda cls: cls._instance is not None or _last_runtime is not None)
+# Stejně tak volba global.appTest (AppTest ji po rerunu vrací na původní hodnotu) - zapnout pro celý proces
+config.set_option("global.appTest", True)
+
+def parse_value_clean(val):
+    """Stejné čtení hodnot jako v app.py ('1 000 Kč' -> 1000.0, '6%' -> 0.06)."""
+    s = str(val).strip().replace(' ', '').replace('Kč', '').replace('Kc', '').replace('\xa0', '')
+    if not s: return 0
+    if '%' in s: return float(s.replace('%', '').replace(',', '.')) / 100.0
+    try: return float(s.replace(',', '.'))
+    except ValueError: return 0
+
+def seed_demo_catalog(engine):
+    """Prázdný ceník naplní syntetickou mřížkou (všechny modely, 2-7 modulů, šířky 3000-6000 mm), příplatky z priplatky.csv."""
+    with engine.begin() as conn:
+        if conn.execute(text("SELECT COUNT(*) FROM cenik")).scalar(): return False
+        rows = [{'model': m, 'sirka_mm': w, 'moduly': mod, 'cena': 40000 + w * 6 + mod * 9000, 'vyska': round(0.9 + w / 8000, 2), 'delka_fix': 0}
+                for m in MODEL_PARAMS if m != "DEFAULT" for mod in range(2, 8) for w in range(3000, 6001, 250)]
+        conn.execute(text("INSERT INTO cenik (model, sirka_mm, moduly, cena, vyska, delka_fix) VALUES (:model, :sirka_mm, :moduly, :cena, :vyska, :delka_fix)"), rows)
+        if not conn.execute(text("SELECT COUNT(*) FROM priplatky")).scalar():
+            rows = []
+            with open(PRIPLATKY_CSV, encoding='utf-8-sig') as f:
+                for line in f:
+                    parts = line.rstrip('\n').split(';')
+                    if len(parts) < 3 or not parts[0].strip(): continue
+                    for kategorie, val in (("Standard", parts[1]), ("Rock", parts[2])):
+                        num = parse_value_clean(val)
+                        rows.append({'nazev': parts[0].strip(), 'kategorie': kategorie,
+                                     'cena_fix': 0 if '%' in val else num, 'cena_pct': num if '%' in val else 0})
+            conn.execute(text("INSERT INTO priplatky (nazev, cena_fix, cena_pct, kategorie) VALUES (:nazev, :cena_fix, :cena_pct, :kategorie)"), rows)
+    return True
+
+class ResourceMonitor:
+    """
+    Spojení do DB (události poolů SQLAlchemy v celém procesu) a vzorkování /proc v samostatném vlákně.
+    pooly = nově vytvořené pooly (engine na rerun), spojeni = nová DBAPI spojení, vypujceno = souběžně vypůjčená spojení.
+    """
+
+    def __init__(self, pg_conn=None):
+        self.lock = threading.Lock()
+        self.pg_conn = pg_conn
+        self.running = False
+        self.reset()
+        event.listen(Pool, "first_connect", self._on_first_connect)
+        event.listen(Pool, "connect", self._on_connect)
+        event.listen(Pool, "checkout", self._on_checkout)
+        event.listen(Pool, "checkin", self._on_checkin)
+
+    def reset(self):
+        with self.lock:
+            self.pools = self.connects = 0
+            self.checked_out = self.checked_out_peak = 0
+            self.chromium_peak = self.rss_peak = self.pg_sessions_peak = 0
+
+    def _on_first_connect(self, dbapi_conn, record):
+        with self.lock: self.pools += 1
+
+    def _on_connect(self, dbapi_conn, record):
+        with self.lock: self.connects += 1
+
+    def _on_checkout(self, dbapi_conn, record, proxy):
+        with self.lock:
+            self.checked_out += 1
+            self.checked_out_peak = max(self.checked_out_peak, self.checked_out)
+
+    def _on_checkin(self, dbapi_conn, record):
+        with self.lock: self.checked_out -= 1
+
+    def sample(self):
+        chromium, rss = 0, _rss_kb(os.getpid())
+        for pid in os.listdir('/proc'):
+            if not pid.isdigit(): continue
+            try:
+                with open(f'/proc/{pid}/cmdline', 'rb') as f: cmd = f.read().lower()
+            except OSError: continue
+            if b'chrom' in cmd or b'headless_shell' in cmd:
+                chromium += 1
+                rss += _rss_kb(pid)
+        pg_sessions = 0
+        if self.pg_conn is not None:
+            pg_sessions = self.pg_conn.execute(text("SELECT COUNT(*) FROM pg_stat_activity WHERE datname = current_database() AND pid <> pg_backend_pid()")).scalar()
+        with self.lock:
+            self.chromium_peak = max(self.chromium_peak, chromium)
+            self.rss_peak = max(self.rss_peak, rss)
+            self.pg_sessions_peak = max(self.pg_sessions_peak, pg_sessions)
+
+    def _loop(self):
+        while self.running:
+            try: self.sample()
+            except Exception: pass
+            time.sleep(SAMPLE_INTERVAL_S)
+
+    def start(self):
+        self.running = True
+        self.thread = threading.Thread(target=self._loop, daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.running = False
+        self.thread.join()
+
+    def snapshot(self):
+        with self.lock:
+            snap = {'db_pooly': self.pools, 'db_spojeni': self.connects, 'db_vypujceno_max': self.checked_out_peak,
+                    'chromium_max': self.chromium_peak, 'pamet_max_mb': self.rss_peak / 1024}
+            if self.pg_conn is not None: snap['pg_sessions_max'] = self.pg_sessions_peak
+            return snap
+
+def _rss_kb(pid):
+    """VmRSS procesu v kB (jen Linux, jinak 0)."""
+    try:
+        with open(f'/proc/{pid}/status') as f:
+            for line in f:
+                if line.startswith('VmRSS:'): return int(line.split()[1])
+    except OSError: pass
+    return 0
+
+def _find(elements, label):
+    return next((e for e in elements if e.label == label or (label.endswith('*') and e.label.startswith(label[:-1]))), None)
+
+def do_action(at, action, rng):
+    """Nastaví widget podle akce. Vrací False, pokud prvek na stránce není (např. chyba ceníku)."""
+    if action == 'moduly':
+        el = _find(at.slider, "Počet modulů")
+        if el is None: return False
+        el.set_value(rng.randint(2, 7))
+    elif action == 'sirka':
+        el = _find(at.number_input, "Šířka (mm)")
+        if el is None: return False
+        el.set_value(rng.randrange(3000, 6001, 10))
+    elif action == 'delka':
+        el = _find(at.number_input, "Délka (std*")
+        if el is None: return False
+        std_len = int(el.label[len("Délka (std "):-1])
+        el.set_value(std_len + rng.choice([0, 0, 500, 1200, 2500]))
+    elif action == 'volba':
+        el = _find(at.checkbox, rng.choice(TOGGLE_OPTIONS))
+        if el is None: return False
+        el.set_value(not el.value)
+    elif action == 'ulozit':
+        el = next((b for b in at.button if b.label == "💾 Uložit"), None)
+        if el is None: return False
+        el.click()
+    return True
+
+def simulate_rep(level, rep_id, actions, pause_s, seed, samples):
+    """Jeden obchodník: otevření stránky, vyplnění zákazníka a náhodné akce. Každý rerun se zapíše do samples."""
+    rng = random.Random(seed * 1000 + rep_id)
+    at = AppTest.from_file(APP_PATH, default_timeout=RERUN_TIMEOUT_S)
+
+    def rerun(action):
+        start = time.perf_counter()
+        try:
+            at.run()
+            chyba = str(at.exception[0].message).splitlines()[0] if at.exception else None
+            if chyba is None and at.error: chyba = str(at.error[0].value)
+        except Exception as e: chyba = f"{type(e).__name__}: {e}"
+        samples.append({'uroven': level, 'obchodnik': rep_id, 'akce': action, 'ms': (time.perf_counter() - start) * 1000, 'chyba': chyba})
+
+    rerun('start')
+    jmeno = _find(at.text_input, "Jméno a příjmení")
+    if jmeno is None:
+        samples.append({'uroven': level, 'obchodnik': rep_id, 'akce': 'zakaznik', 'ms': None, 'chyba': "stránka se nevykreslila"})
+        return
+    jmeno.set_value(f"Zátěžový test {level}-{rep_id}")
+    rerun('zakaznik')
+    names, weights = list(ACTION_WEIGHTS), list(ACTION_WEIGHTS.values())
+    for _ in range(actions):
+        if pause_s: time.sleep(rng.uniform(0, pause_s))
+        action = rng.choices(names, weights)[0]
+        if not do_action(at, action, rng):
+            samples.append({'uroven': level, 'obchodnik': rep_id, 'akce': action, 'ms': None, 'chyba': "prvek nenalezen"})
+            continue
+        rerun(action)
+
+def run_level(level, actions, pause_s, seed, monitor):
+    """Spustí `level` souběžných obchodníků, vrací (vzorky rerunů, souhrn zdrojů, celkový čas)."""
+    samples = []
+    monitor.reset()
+    monitor.start()
+    start = time.perf_counter()
+    threads = [threading.Thread(target=simulate_rep, args=(level, i, actions, pause_s, seed, samples)) for i in range(level)]
+    for t in threads: t.start()
+    for t in threads: t.join()
+    elapsed = time.perf_counter() - start
+    monitor.stop()
+    monitor.sample()
+    return samples, monitor.snapshot(), elapsed
+
+def level_summary(df, level, resources, elapsed):
+    ok = df[df['ms'].notna()]
+    row = {'uroven': level, 'reruny': len(ok), 'chyby': int(df['chyba'].notna().sum()), 'reruny_s': len(ok) / elapsed if elapsed else 0}
+    for q in PERCENTILES: row[f'p{int(q * 100)}_ms'] = ok['ms'].quantile(q) if not ok.empty else None
+    row['max_ms'] = ok['ms'].max() if not ok.empty else None
+    row.update(resources)
+    return row
+
+def main():
+    parser = argparse.ArgumentParser(description="Zátěžový test kalkulátoru - souběžní obchodníci.")
+    parser.add_argument("--urovne", default="1,2,5,10", help="počty souběžných obchodníků, např. 1,2,5,10")
+    parser.add_argument("--akce", type=int, default=20, help="počet akcí na obchodníka a úroveň")
+    parser.add_argument("--pauza", type=float, default=0.0, help="max. náhodná pauza mezi akcemi v s (0 = nejhorší případ)")
+    parser.add_argument("--limit-ms", type=float, default=2000, help="p95 rerunu, nad kterou je úroveň označena jako nevyhovující")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--db", default=None, help="URL lokální DB (výchozí DATABASE_URL, jinak dočasná SQLite)")
+    parser.add_argument("--demo-cenik", action="store_true", help="naplnit prázdný ceník demo daty (u dočasné SQLite vždy)")
+    parser.add_argument("--out", default=None, help="prefix CSV výstupů (<out>_souhrn.csv, <out>_reruny.csv)")
+    args = parser.parse_args()
+
+    db_url = args.db or os.environ.get("DATABASE_URL")
+    seed_catalog = args.demo_cenik
+    if not db_url:
+        db_url = "sqlite:///" + os.path.join(tempfile.mkdtemp(prefix="zatez_"), "zatez.db")
+        seed_catalog = True
+    if db_url.startswith("postgres://"):
+        db_url = db_url.replace("postgres://", "postgresql://", 1)
+    os.environ["DATABASE_URL"] = db_url
+    levels = [int(x) for x in args.urovne.split(",") if x.strip()]
+    print(f"DB: {db_url.split('@')[-1]}, úrovně: {levels}, akcí na obchodníka: {args.akce}")
+
+    # Zahřátí: import knihoven a vytvoření tabulek aplikací, případně demo ceník
+    at = AppTest.from_file(APP_PATH, default_timeout=RERUN_TIMEOUT_S)
+    at.run()
+    engine = create_engine(db_url)
+    if seed_catalog and seed_demo_catalog(engine): print("Prázdný ceník naplněn demo daty.")
+    at.run()
+    if at.exception: sys.exit(f"Aplikace nejde spustit: {at.exception[0].message}")
+
+    # Sledovací spojení do Postgresu se otevře před registrací událostí, aby se nezapočítávalo
+    pg_conn = engine.connect() if engine.dialect.name == "postgresql" else None
+    monitor = ResourceMonitor(pg_conn)
+    all_samples, summary = [], []
+    for level in levels:
+        samples, resources, elapsed = run_level(level, args.akce, args.pauza, args.seed, monitor)
+        df = pd.DataFrame(samples)
+        row = level_summary(df, level, resources, elapsed)
+        summary.append(row)
+        all_samples.extend(samples)
+        print(f"{level:>3} obchodníků: {row['reruny']} rerunů za {elapsed:.1f} s, p95 {row['p95_ms'] or 0:,.0f} ms, chyby {row['chyby']}")
+
+    df_samples, df_summary = pd.DataFrame(all_samples), pd.DataFrame(summary).set_index('uroven')
+    with pd.option_context('display.width', 200, 'display.max_columns', 30, 'display.float_format', '{:,.0f}'.format):
+        print("\n--- Souhrn dle úrovně souběhu ---")
+        print(df_summary.to_string())
+        ok = df_samples[df_samples['ms'].notna()]
+        print("\n--- Latence rerunu dle akce (ms) ---")
+        print(ok.groupby(['uroven', 'akce'])['ms'].describe(percentiles=PERCENTILES)[['count', '50%', '95%', 'max']].unstack('akce').to_string())
+    errors = Counter(df_samples['chyba'].dropna())
+    if errors:
+        print("\n--- Nejčastější chyby ---")
+        for msg, cnt in errors.most_common(10): print(f"{cnt:>5}x  {msg[:150]}")
+
+    failing = df_summary[(df_summary['p95_ms'] > args.limit_ms) | (df_summary['chyby'] > 0)]
+    if failing.empty: print(f"\nVšechny úrovně vyhověly (p95 <= {args.limit_ms:,.0f} ms, bez chyb).")
+    else: print(f"\nPrvní nevyhovující úroveň: {failing.index[0]} obchodníků (p95 > {args.limit_ms:,.0f} ms nebo chyby).")
+    if args.out:
+        df_summary.to_csv(f"{args.out}_souhrn.csv", sep=';', encoding='utf-8-sig')
+        df_samples.to_csv(f"{args.out}_reruny.csv", index=False, sep=';', encoding='utf-8-sig')
+    if pg_conn is not None: pg_conn.close()
+
+if __name__ == "__main__":
+    main()
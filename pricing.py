@@ -0,0 +1,344 @@
+"""
+Cenová logika kalkulátoru bez Streamlitu: geometrie modelů a výpočet položek nabídky.
+Používá ji aplikace (app.py) i nástroje nad archivem (replay.py).
+"""
+import math
+from cutting_plan import make_piece, optimize_cutting_plan
+
+# --- KONFIGURACE VÝROBY ---
+ROOF_OVERLAP_MM = 100 
+FACE_WASTE_COEF = 0.82 
+MIN_MODULE_LEN_MM = 1800 
+STANDARD_MODULE_LEN_MM = 2190
+
+# --- KATEGORIE MODELŮ (DEFINICE DLE UŽIVATELE) ---
+# 1. BOX: Nízké, hranaté (Flash, Wing, Dream) -> Málo poly, Hodně profilu (Rám)
+BOX_MODELS = ["FLASH", "WING", "DREAM"]
+
+# 2. HIGH: Vysoké, svislé stěny (Rock, Terrace, Harmony, Sunset, Wave) -> Korekce oproti bublině
+HIGH_MODELS = ["TERRACE", "ROCK", "HARMONY", "SUNSET", "WAVE"]
+
+# 3. ARCH: Střední, obloukové (Practic, Horizont, Star) -> Čistá geometrie
+ARCH_MODELS = ["PRACTIC", "HORIZONT", "STAR", "DEFAULT"]
+
+# Korekce plochy polykarbonátu střechy dle skupiny
+POLY_CORRECTION = {"BOX": 0.80, "HIGH": 0.85, "ARCH": 1.0}
+# Materiály polykarbonátu pro plán řezání (každý se řeže ze svých desek)
+POLY_MATERIALS = {"plny": "Plný polykarbonát", "standard": "Standardní polykarbonát"}
+
+# --- DEFINICE MODELŮ ---
+MODEL_PARAMS = {
+    "PRACTIC":  {"step_w": 100, "step_h": 50, "img": "practic.png"},
+    "DREAM":    {"step_w": 130, "step_h": 65, "img": "dream.png"},
+    "HARMONY":  {"step_w": 130, "step_h": 65, "img": "harmony.png"},
+    "ROCK":     {"step_w": 130, "step_h": 65, "img": "rock.png"},
+    "TERRACE":  {"step_w": 71,  "step_h": 65, "img": "terrace.png"}, 
+    "HORIZONT": {"step_w": 130, "step_h": 65, "img": "horizont.png"}, 
+    "STAR":     {"step_w": 130, "step_h": 65, "img": "star.png"},
+    "WAVE":     {"step_w": 146, "step_h": 70, "img": "wave.png"},
+    "FLASH":    {"step_w": 146, "step_h": 70, "img": "flash.png"},
+    "WING":     {"step_w": 130, "step_h": 65, "img": "wing.png"},
+    "SUNSET":   {"step_w": 130, "step_h": 65, "img": "sunset.png"},
+    "DEFAULT":  {"step_w": 100, "step_h": 50, "img": None}
+}
+
+STD_LENGTHS = {2: 4336, 3: 6446, 4: 8556, 5: 10666, 6: 12776, 7: 14886}
+
+
+# Výchozí hodnoty vstupů kalkulace (odpovídají výchozím hodnotám formuláře, pocet_prod_modulu None = počet modulů)
+OFFER_DEFAULTS = {
+    'model': "PRACTIC", 'moduly': 3, 'sirka': 3500, 'celkova_delka': None, 'pocet_prod_modulu': None, 'zvyseni_cm': 0,
+    'barva_typ': "Stříbrný Elox (Bonus -10 000 Kč)", 'ral_kod': "", 'poly_strecha': False, 'poly_celo_male': False, 'poly_celo_velke': False,
+    'change_color_poly': False, 'poly_dle_planu': False, 'pocet_dvere_vc': 0, 'pocet_dvere_bok': 0,
+    'zamykaci_klika': False, 'uzamykani_segmentu': False, 'klapka': False, 'bez_maleho_cela': False, 'bez_velkeho_cela': False, 'vyklopne_celo': False,
+    'pochozi_koleje': False, 'pochozi_koleje_zdarma': False, 'obousmerne_koleje': False, 'ext_draha_m': 0.0, 'podhori': False,
+    'km': 0, 'cena_za_km': 18, 'montaz': True, 'sleva_pct': 0, 'dph_sazba': 21,
+}
+
+def geometry_segment_values(width_mm, height_mm):
+    """Vrací (Plocha_pro_výrobu, Délka_oblouku_mm, Čistá_geometrická_plocha)"""
+    if width_mm <= 0: return 0, 0, 0
+    if height_mm <= 0: height_mm = 1
+    s = width_mm
+    v = height_mm
+    try:
+        R = ((s**2 / 4) + v**2) / (2 * v)
+        if R <= 0: arc_len = s
+        else:
+            ratio = s / (2 * R)
+            if ratio > 1: ratio = 1
+            if ratio < -1: ratio = -1
+            alpha_rad = 2 * math.asin(ratio)
+            arc_len = alpha_rad * R
+    except: arc_len = s
+
+    raw_rect_area = (s * v) / 1_000_000 
+    production_area = raw_rect_area * FACE_WASTE_COEF # Pouze pro čela
+    return production_area, arc_len, raw_rect_area
+
+def geometry_segment_area(width_mm, height_mm):
+    """Skutečná plocha kruhové úseče čela v m² (bez koeficientu odpadu)."""
+    if width_mm <= 0 or height_mm <= 0: return 0
+    R = ((width_mm**2 / 4) + height_mm**2) / (2 * height_mm)
+    alpha = 2 * math.asin(min(width_mm / (2 * R), 1))
+    if height_mm > R: alpha = 2 * math.pi - alpha
+    return (R**2 / 2) * (alpha - math.sin(alpha)) / 1_000_000
+
+def model_category(model_name):
+    if model_name.upper() in BOX_MODELS: return "BOX"
+    if model_name.upper() in HIGH_MODELS: return "HIGH"
+    return "ARCH"
+
+def calculate_smart_geometry(model_name, width_input_mm, height_input_mm, modules, total_length_mm):
+    """
+    Chytrý výpočet geometrie pro 3 skupiny modelů: BOX, HIGH, ARCH.
+    Vrací: (Plocha Poly pro cenu, Plocha čel, Délka konstrukce pro prodloužení)
+    """
+    params = MODEL_PARAMS.get(model_name.upper(), MODEL_PARAMS["DEFAULT"])
+    step_w = params["step_w"]
+    step_h = params["step_h"]
+
+    # 1. Základní geometrie segmentů (Malý a Velký)
+    w_small = width_input_mm
+    h_small = height_input_mm
+    area_face_small, arc_small, _ = geometry_segment_values(w_small, h_small)
+    
+    w_large = width_input_mm + ((modules - 1) * step_w)
+    h_large = height_input_mm + ((modules - 1) * step_h)
+    area_face_large, arc_large, _ = geometry_segment_values(w_large, h_large)
+    
+    avg_arc_len_mm = (arc_small + arc_large) / 2.0
+    avg_width = (w_small + w_large) / 2.0
+    avg_height = (h_small + h_large) / 2.0
+
+    # 2. LOGIKA DLE SKUPIN (The Three Sisters Logic)
+    
+    model_cat = model_category(model_name)
+    
+    poly_correction = 1.0
+    struct_len_mm = avg_arc_len_mm # Default
+
+    if model_cat == "BOX":
+        # FLASH, WING, DREAM
+        # Poly: Placka (korekce 0.8)
+        poly_correction = POLY_CORRECTION["BOX"]
+        # Konstrukce: Rám (Šířka + 2*Výška) - mnohem víc materiálu než oblouk
+        struct_len_mm = avg_width + (1.8 * avg_height)
+        
+    elif model_cat == "HIGH":
+        # ROCK, TERRACE, HARMONY
+        # Poly: Svislé stěny (korekce 0.85, aby nebyla bublina)
+        poly_correction = POLY_CORRECTION["HIGH"]
+        # Konstrukce: Oblouk s korekcí (nebo čistý oblouk, dle Rock testu)
+        struct_len_mm = avg_arc_len_mm * 0.9 # Lehká korekce, Rock má méně "masa" než plná bublina
+        
+    else: # ARCH (PRACTIC, HORIZONT)
+        # Poly: Čistý oblouk
+        poly_correction = POLY_CORRECTION["ARCH"]
+        # Konstrukce: Čistý oblouk
+        struct_len_mm = avg_arc_len_mm
+
+    # 3. Finální hodnoty
+    total_roof_area_poly = (avg_arc_len_mm / 1000.0) * (total_length_mm / 1000.0) * poly_correction
+    total_struct_len_m_sum = (struct_len_mm * modules) / 1000.0
+    
+    return total_roof_area_poly, area_face_large, area_face_small, total_struct_len_m_sum, model_cat
+
+def poly_cut_pieces(model_name, width_input_mm, height_input_mm, modules, total_length_mm, roof=True, face_small=True, face_large=True):
+    """Díly polykarbonátu pro plán řezání - stejná geometrie segmentů jako calculate_smart_geometry."""
+    params = MODEL_PARAMS.get(model_name.upper(), MODEL_PARAMS["DEFAULT"])
+    poly_correction = POLY_CORRECTION[model_category(model_name)]
+    module_len = total_length_mm / modules
+    pieces = []
+    if roof:
+        for i in range(modules):
+            _, arc_len, _ = geometry_segment_values(width_input_mm + i * params["step_w"], height_input_mm + i * params["step_h"])
+            pieces.append(make_piece("strecha", f"Střecha seg. {i + 1}", arc_len * poly_correction, module_len + ROOF_OVERLAP_MM))
+    if face_small:
+        pieces.append(make_piece("celo_male", "Malé čelo", width_input_mm, height_input_mm, geometry_segment_area(width_input_mm, height_input_mm)))
+    if face_large:
+        w_large = width_input_mm + (modules - 1) * params["step_w"]
+        h_large = height_input_mm + (modules - 1) * params["step_h"]
+        pieces.append(make_piece("celo_velke", "Velké čelo", w_large, h_large, geometry_segment_area(w_large, h_large)))
+    return pieces
+
+def calculate_cutting_plans(model_name, width_input_mm, height_input_mm, modules, total_length_mm, face_small=True, face_large=True,
+                            solid_parts=(), materials=POLY_MATERIALS, time_budget_s=None):
+    """
+    Plány řezání po materiálech - plný a standardní poly jsou jiné desky a nesmí se řezat spolu.
+    solid_parts = díly objednané v plném poly ('strecha', 'celo_male', 'celo_velke'). Vrací {materiál: plán} pro neprázdné skupiny.
+    """
+    pieces = poly_cut_pieces(model_name, width_input_mm, height_input_mm, modules, total_length_mm, face_small=face_small, face_large=face_large)
+    plans = {}
+    for material in materials:
+        group = [p for p in pieces if (p['dil'] in solid_parts) == (material == "plny")]
+        if group: plans[material] = optimize_cutting_plan(group, overlap_mm=ROOF_OVERLAP_MM, time_budget_s=time_budget_s)
+    return plans
+
+def solid_poly_parts(inputs):
+    """Díly objednané v plném polykarbonátu (vynechaná čela se nepočítají)."""
+    parts = set()
+    if inputs.get('poly_strecha'): parts.add("strecha")
+    if inputs.get('poly_celo_male') and not inputs.get('bez_maleho_cela'): parts.add("celo_male")
+    if inputs.get('poly_celo_velke') and not inputs.get('bez_velkeho_cela'): parts.add("celo_velke")
+    return parts
+
+def calculate_offer_items(inputs, base_price, height, surcharge, with_cut_plan=True):
+    """
+    Položky nabídky pro vstupy kalkulace (klíče jako v data_json uložené nabídky, chybějící dle OFFER_DEFAULTS).
+    surcharge(search_term, is_rock) -> {"fix", "pct"}: vyhledání příplatku (DB, historie cen nebo snapshot ceníku).
+    with_cut_plan=False počítá jen plán plného poly, a to jen pokud je potřeba pro cenu (hromadný přepočet).
+    Vrací (items, totals, info) - info jsou mezivýsledky pro debug výpis a plán řezání.
+    """
+    inp = {**OFFER_DEFAULTS, **{k: v for k, v in inputs.items() if v is not None}}
+    model, moduly, sirka = inp['model'], inp['moduly'], inp['sirka']
+    is_rock = (model.upper() == "ROCK")
+    std_len = STD_LENGTHS.get(moduly, moduly * STANDARD_MODULE_LEN_MM)
+    celkova_delka = inp['celkova_delka'] or std_len
+    diff_len = celkova_delka - std_len
+    pocet_prod_modulu = (inp['pocet_prod_modulu'] or moduly) if diff_len > 10 else 1
+    zvyseni_cm, barva_typ = inp['zvyseni_cm'], inp['barva_typ']
+    bez_maleho_cela, bez_velkeho_cela = inp['bez_maleho_cela'], inp['bez_velkeho_cela']
+    pochozi_koleje, pochozi_koleje_zdarma, obousmerne_koleje = inp['pochozi_koleje'], inp['pochozi_koleje_zdarma'], inp['obousmerne_koleje']
+
+    items = []
+    items.append({"pol": f"Zastřešení {model}", "det": f"{moduly} seg., Š:{sirka}mm", "cen": base_price})
+    
+    if zvyseni_cm > 0:
+        p_zvyseni = surcharge("Zvýšení zastřešení", is_rock)
+        def_pct = 0.02 if is_rock else 0.03
+        pct_per_10cm = p_zvyseni['pct'] if p_zvyseni['pct'] > 0 else def_pct
+        steps = zvyseni_cm / 10
+        items.append({"pol": f"Zvýšení o {zvyseni_cm} cm", "det": f"+{pct_per_10cm * steps * 100:.0f}%", "cen": base_price * pct_per_10cm * steps})
+
+    # VOLÁNÍ CHYTRÉ GEOMETRIE
+    roof_a_poly, face_a_large, face_a_small, total_struct_len_m_sum, model_cat = calculate_smart_geometry(model, sirka, height, moduly, celkova_delka)
+    solid_parts = solid_poly_parts(inp)
+    cut_plans, cut_plan_error = {}, None
+    if with_cut_plan or (inp['poly_dle_planu'] and solid_parts):
+        try: cut_plans = calculate_cutting_plans(model, sirka, height, moduly, celkova_delka, face_small=not bez_maleho_cela, face_large=not bez_velkeho_cela,
+                                                 solid_parts=solid_parts, materials=POLY_MATERIALS if with_cut_plan else ("plny",))
+        except ValueError as e: cut_plan_error = str(e)
+    
+    # --- DEBUG VARIABLES ---
+    info = {'diff_len': diff_len, 'pocet_prod_modulu': pocet_prod_modulu, 'atyp_fee': 0, 'extension_area': 0,
+            'debug_ext_fix': 0, 'debug_ext_mat': 0, 'debug_ext_rail': 0, 'debug_ext_total': 0,
+            'model_cat': model_cat, 'roof_a_poly': roof_a_poly, 'cut_plans': cut_plans, 'cut_plan_error': cut_plan_error}
+
+    if diff_len > 10:
+        p_atyp_fix = surcharge("Prodloužení modulu", is_rock)
+        atyp_fee = p_atyp_fix['fix'] if p_atyp_fix['fix'] > 0 else 3000
+        total_fix_fee = pocet_prod_modulu * atyp_fee
+        
+        p_var_mat = surcharge("Prodloužení modulu za metr", is_rock)
+        price_per_m2_material = p_var_mat['fix'] if p_var_mat['fix'] > 0 else 2000
+        
+        # Výpočet materiálu prodloužení podle skupiny modelů
+        avg_struct_len_m = total_struct_len_m_sum / moduly
+        extension_area = avg_struct_len_m * (diff_len / 1000.0) 
+        
+        material_cost = extension_area * price_per_m2_material
+        
+        rail_cost = 0
+        p_rail_unit = surcharge("Jeden metr koleje", is_rock)
+        price_rail_std = p_rail_unit['fix'] if p_rail_unit['fix'] > 0 else 220
+        
+        rail_price_used = price_rail_std
+        if pochozi_koleje or obousmerne_koleje:
+             p_rail_prem = surcharge("Pochozí kolejnice", is_rock)
+             price_rail_prem = p_rail_prem['fix'] if p_rail_prem['fix'] > 0 else 330
+             if pochozi_koleje_zdarma: rail_price_used = 0 
+             else: rail_price_used = price_rail_prem
+        
+        rail_cost = (diff_len / 1000.0) * 2 * rail_price_used
+        
+        total_ext_cost = total_fix_fee + material_cost + rail_cost
+        info.update({'atyp_fee': atyp_fee, 'extension_area': extension_area, 'debug_ext_fix': total_fix_fee,
+                     'debug_ext_mat': material_cost, 'debug_ext_rail': rail_cost, 'debug_ext_total': total_ext_cost})
+        
+        det_txt = f"+{diff_len} mm"
+        items.append({"pol": f"Prodloužení {pocet_prod_modulu} mod. (ATYP)", "det": det_txt, "cen": total_ext_cost})
+
+    elif diff_len < -10:
+         p_zkrac = surcharge("Zkrácení modulu", is_rock)
+         price_per_mod = p_zkrac['fix'] if p_zkrac['fix'] > 0 else 2000
+         items.append({"pol": f"Zkrácení zastřešení (Atyp)", "det": f"{moduly} ks x {price_per_mod:,.0f} Kč", "cen": moduly * price_per_mod})
+
+    if "Stříbrný" in barva_typ: items.append({"pol": "BONUS: Stříbrný Elox", "det": "-10%", "cen": base_price * -0.10})
+    elif "RAL" in barva_typ: 
+        p = surcharge("RAL", is_rock)
+        items.append({"pol": f"RAL {inp['ral_kod']}", "det": "", "cen": base_price * (p['pct'] or 0.20)})
+    elif "Bronz" in barva_typ:
+        p = surcharge("BR elox", is_rock)
+        items.append({"pol": "Bronz Elox", "det": "", "cen": base_price * (p['pct'] or 0.05)})
+    elif "Antracit" in barva_typ:
+        p = surcharge("antracit elox", is_rock)
+        items.append({"pol": "Antracit Elox", "det": "", "cen": base_price * (p['pct'] or 0.05)})
+
+    p_poly_price = surcharge("Plný polykarbonát", is_rock)
+    poly_base_price = p_poly_price['fix'] if p_poly_price['fix'] > 10 else 1000
+    
+    if inp['poly_dle_planu'] and "plny" in cut_plans:
+        # Cena z plánu řezání: čistá plocha dílu + poměrný skutečný odpad desek
+        plan_parts = cut_plans['plny']['dily']
+        if inp['poly_strecha']: items.append({"pol": "Plný poly (Střecha)", "det": f"{plan_parts['strecha']['brutto_m2']:.1f} m² (dle plánu řezání)", "cen": plan_parts['strecha']['brutto_m2'] * poly_base_price})
+        if inp['poly_celo_male'] and not bez_maleho_cela: items.append({"pol": "Plný poly (M. čelo)", "det": f"{plan_parts['celo_male']['brutto_m2']:.1f} m² (dle plánu řezání)", "cen": plan_parts['celo_male']['brutto_m2'] * poly_base_price})
+        if inp['poly_celo_velke'] and not bez_velkeho_cela: items.append({"pol": "Plný poly (V. čelo)", "det": f"{plan_parts['celo_velke']['brutto_m2']:.1f} m² (dle plánu řezání)", "cen": plan_parts['celo_velke']['brutto_m2'] * poly_base_price})
+    else:
+        if inp['poly_strecha']: 
+            # Cena se nyní počítá z CHYTRÉ plochy (různá pro BOX/HIGH/ARCH)
+            cost_poly_roof = roof_a_poly * poly_base_price * 1.1
+            items.append({"pol": "Plný poly (Střecha)", "det": f"{roof_a_poly:.1f} m² (Geo: {model_cat})", "cen": cost_poly_roof})
+        
+        if inp['poly_celo_male'] and not bez_maleho_cela: items.append({"pol": "Plný poly (M. čelo)", "det": f"{face_a_small:.1f} m²", "cen": face_a_small * poly_base_price})
+        if inp['poly_celo_velke'] and not bez_velkeho_cela: items.append({"pol": "Plný poly (V. čelo)", "det": f"{face_a_large:.1f} m²", "cen": face_a_large * poly_base_price})
+    
+    if inp['change_color_poly']:
+         p = surcharge("barvy poly", is_rock)
+         items.append({"pol": "Změna barvy poly", "det": "", "cen": base_price * (p['pct'] or 0.07)})
+
+    p_vc = surcharge("Jednokřídlé dveře", is_rock)['fix'] or 5000
+    p_bok = surcharge("boční vstup", is_rock)['fix'] or 7000
+    doors = []
+    for _ in range(inp['pocet_dvere_vc']): doors.append(("Dveře VČ", p_vc))
+    for _ in range(inp['pocet_dvere_bok']): doors.append(("Boční vstup", p_bok))
+    if doors:
+        doors.sort(key=lambda x: x[1], reverse=True)
+        items.append({"pol": f"{doors[0][0]} (1. ks)", "det": "ZDARMA", "cen": 0})
+        for d in doors[1:]: items.append({"pol": d[0], "det": "", "cen": d[1]})
+
+    if inp['zamykaci_klika'] and len(doors) > 0:
+         p = surcharge("Uzamykání dveří", is_rock)['fix'] or 800
+         items.append({"pol": "Zamykací klika", "det": f"{len(doors)} ks", "cen": len(doors) * p})
+    if inp['uzamykani_segmentu']: items.append({"pol": "Uzamykání segmentů", "det": "", "cen": 1500})
+    if inp['klapka']: 
+        p = surcharge("klapka", is_rock)['fix'] or 7000
+        items.append({"pol": "Větrací klapka", "det": "", "cen": p})
+    if inp['vyklopne_celo']: items.append({"pol": "Výklopné čelo", "det": "", "cen": 5000})
+
+    if pochozi_koleje: items.append({"pol": "Pochozí koleje", "det": "", "cen": 0})
+    if obousmerne_koleje:
+        rail_len = (celkova_delka / 1000.0) * 2
+        if pochozi_koleje_zdarma: items.append({"pol": "Obousměrné koleje", "det": "AKCE", "cen": 0})
+        else:
+            p = surcharge("Pochozí kolejnice", is_rock)['fix'] or 330
+            items.append({"pol": "Obousměrné koleje", "det": f"{rail_len:.1f} m", "cen": rail_len * p})
+    if inp['ext_draha_m'] > 0:
+         p = surcharge("Jeden metr koleje", is_rock)['fix'] or 220
+         items.append({"pol": "Prodloužení dráhy", "det": f"{inp['ext_draha_m']} m", "cen": inp['ext_draha_m'] * p})
+    if inp['podhori']:
+         p = surcharge("podhorskou", is_rock)
+         items.append({"pol": "Zpevnění Podhoří", "det": "15%", "cen": base_price * (p['pct'] or 0.15)})
+
+    mat_sum = sum(x['cen'] for x in items)
+    if inp['montaz']:
+         p = surcharge("Montáž zastřešení v ČR", is_rock)
+         pct = p['pct'] if p['pct'] > 0 else 0.08
+         items.append({"pol": "Montáž", "det": f"{pct*100:.0f}%", "cen": mat_sum * pct})
+    if inp['sleva_pct'] > 0: items.append({"pol": "SLEVA", "det": f"-{inp['sleva_pct']}%", "cen": -mat_sum * (inp['sleva_pct']/100.0)})
+    if inp['km'] > 0: items.append({"pol": "Doprava", "det": f"{inp['km']} km", "cen": inp['km'] * inp['cena_za_km']})
+
+    total_no_vat = sum(i['cen'] for i in items)
+    total_vat = total_no_vat * (1 + inp['dph_sazba']/100.0)
+    totals = {'bez_dph': total_no_vat, 'dph': total_vat - total_no_vat, 's_dph': total_vat, 'sazba_dph': inp['dph_sazba']}
+    return items, totals, info
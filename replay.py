@@ -0,0 +1,202 @@
+"""
+Přepočet archivních nabídek podle aktuální cenové logiky (pricing.py).
+Nabídky se čtou z DB server-side kurzorem, přepočítávají paralelně v process poolu a porovnají s uloženou cenou.
+
+Použití:
+    python replay.py [--ceny aktualni|datum-nabidky|2025-03-01] [--workers N] [--tolerance 1] [--out drift]
+
+--ceny aktualni       dnešní ceník (dopad změn logiky i cen)
+--ceny datum-nabidky  ceník platný v den nabídky (jen dopad změn logiky, vyžaduje historii cen)
+--ceny RRRR-MM-DD     ceník k danému dni
+"""
+import argparse
+import json
+import os
+import re
+import sys
+import time
+from bisect import bisect_left
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+from datetime import datetime
+
+import pandas as pd
+from sqlalchemy import create_engine, text, DateTime
+
+from pricing import calculate_offer_items
+
+REPLAY_CHUNK_SIZE = 500
+OFFER_COLUMNS = ['id', 'datum', 'model', 'kategorie', 'cena_puvodni', 'cena_nova', 'rozdil', 'rozdil_pct', 'stav']
+ITEM_COLUMNS = ['id', 'model', 'kategorie', 'polozka', 'cena_puvodni', 'cena_nova', 'rozdil']
+
+def get_engine(db_url=None):
+    db_url = db_url or os.environ.get("DATABASE_URL")
+    if not db_url: sys.exit("Chybí DATABASE_URL.")
+    if db_url.startswith("postgres://"):
+        db_url = db_url.replace("postgres://", "postgresql://", 1)
+    return create_engine(db_url)
+
+def load_catalog(conn, use_history=False):
+    """Ceník do paměti. S historií včetně intervalů platnosti, jinak aktuální tabulky (platné vždy)."""
+    if use_history:
+        validity = {'platne_od': DateTime, 'platne_do': DateTime}
+        cenik = conn.execute(text("SELECT model, sirka_mm, moduly, cena, vyska, platne_od, platne_do FROM cenik_historie ORDER BY cenik_id, platne_od").columns(**validity)).all()
+        priplatky = conn.execute(text("SELECT nazev, cena_fix, cena_pct, kategorie, platne_od, platne_do FROM priplatky_historie ORDER BY priplatek_id, platne_od").columns(**validity)).all()
+    else:
+        cenik = conn.execute(text("SELECT model, sirka_mm, moduly, cena, vyska, NULL, NULL FROM cenik ORDER BY id")).all()
+        priplatky = conn.execute(text("SELECT nazev, cena_fix, cena_pct, kategorie, NULL, NULL FROM priplatky ORDER BY id")).all()
+    return {'cenik': [tuple(r) for r in cenik], 'priplatky': [tuple(r) for r in priplatky]}
+
+def _valid(row_from, row_to, at):
+    if at is None: return True
+    return (row_from is None or row_from <= at) and (row_to is None or row_to > at)
+
+class Catalog:
+    """In-memory obdoba get_surcharge_db / calculate_base_price_db (stejné pořadí a pravidla shody)."""
+
+    def __init__(self, data):
+        self.cenik = {}
+        for model, sirka, moduly, cena, vyska, od, do in data['cenik']:
+            self.cenik.setdefault((model, moduly), []).append((sirka, cena, vyska, od, do))
+        for rows in self.cenik.values(): rows.sort(key=lambda r: r[0])
+        # Intervaly platnosti po modelech - "prázdný ceník" se posuzuje k okamžiku jako v calculate_base_price_db
+        self.cenik_models = {}
+        for model, _, _, _, _, od, do in data['cenik']: self.cenik_models.setdefault(model, []).append((od, do))
+        self.priplatky = [(nazev.lower() if nazev else "", fix, pct, kat, od, do) for nazev, fix, pct, kat, od, do in data['priplatky']]
+
+    def base_price(self, model, width_mm, modules, at=None):
+        if not any(_valid(od, do, at) for od, do in self.cenik_models.get(model, [])): return 0, 0, f"Ceník pro {model} je prázdný!"
+        rows = [r for r in self.cenik.get((model, modules), []) if _valid(r[3], r[4], at)]
+        idx = bisect_left([r[0] for r in rows], width_mm)
+        if idx < len(rows): return rows[idx][1], rows[idx][2] * 1000, None
+        if rows: return 0, 0, f"Mimo rozsah (Max pro {model} je {rows[-1][0]} mm)"
+        return 0, 0, "Rozměr nebo počet modulů nenalezen"
+
+    def surcharge(self, search_term, is_rock=False, at=None):
+        term = search_term.lower()
+        def find(cat):
+            return next((p for p in self.priplatky if p[3] == cat and term in p[0] and _valid(p[4], p[5], at)), None)
+        item = find("Rock" if is_rock else "Standard")
+        if not item and is_rock: item = find("Standard")
+        if item: return {"fix": item[1] or 0, "pct": item[2] or 0}
+        return {"fix": 0, "pct": 0}
+
+_catalog = None
+_prices_at = None
+
+def _init_worker(catalog_data, prices_at):
+    global _catalog, _prices_at
+    _catalog = Catalog(catalog_data)
+    _prices_at = prices_at
+
+def item_key(pol):
+    """Název položky bez čísel (např. 'Zvýšení o 20 cm' -> 'Zvýšení o # cm') pro souhrn po položkách."""
+    return re.sub(r"\d+([.,]\d+)?", "#", pol)
+
+def _items_by_key(items):
+    sums = {}
+    for it in items: sums[item_key(it['pol'])] = sums.get(item_key(it['pol']), 0) + (it['cen'] or 0)
+    return sums
+
+def replay_offer(offer_id, datum, model, cena_celkem, data_json):
+    """Vrací (výsledek nabídky, rozdíly po položkách)."""
+    data = json.loads(data_json) if data_json else {}
+    result = {'id': offer_id, 'datum': datum, 'model': data.get('model') or model, 'kategorie': None,
+              'cena_puvodni': cena_celkem, 'cena_nova': None, 'rozdil': None, 'rozdil_pct': None, 'stav': 'ok'}
+    if not data.get('sirka') or not data.get('moduly'):
+        result['stav'] = 'neúplná data'
+        return result, []
+    at = datum if _prices_at == 'datum-nabidky' else _prices_at
+    base_price, height, err = _catalog.base_price(result['model'], data['sirka'], data['moduly'], at)
+    if err:
+        result['stav'] = err
+        return result, []
+    items, totals, info = calculate_offer_items({**data, 'model': result['model']}, base_price, height,
+                                                lambda term, rock: _catalog.surcharge(term, rock, at), with_cut_plan=False)
+    result.update({'kategorie': info['model_cat'], 'cena_nova': totals['s_dph'], 'rozdil': totals['s_dph'] - (cena_celkem or 0),
+                   'rozdil_pct': (totals['s_dph'] / cena_celkem - 1) * 100 if cena_celkem else None})
+    item_rows = []
+    if 'polozky' in data:
+        old, new = _items_by_key(data['polozky']), _items_by_key(items)
+        for key in old.keys() | new.keys():
+            item_rows.append({'id': offer_id, 'model': result['model'], 'kategorie': info['model_cat'], 'polozka': key,
+                              'cena_puvodni': old.get(key, 0), 'cena_nova': new.get(key, 0), 'rozdil': new.get(key, 0) - old.get(key, 0)})
+    return result, item_rows
+
+def replay_chunk(rows):
+    offers, items = [], []
+    for row in rows:
+        try: offer, offer_items = replay_offer(*row)
+        except Exception as e:
+            offer, offer_items = {'id': row[0], 'model': row[2], 'cena_puvodni': row[3], 'stav': f"chyba: {e}"}, []
+        offers.append(offer)
+        items.extend(offer_items)
+    return offers, items
+
+def run_replay(engine, prices="aktualni", workers=None, chunk_size=REPLAY_CHUNK_SIZE):
+    """Přepočítá celý archiv. Vrací (DataFrame nabídek, DataFrame položek)."""
+    prices_at = None if prices == "aktualni" else prices if prices == "datum-nabidky" else datetime.fromisoformat(prices)
+    with engine.connect() as conn: catalog = load_catalog(conn, use_history=prices_at is not None)
+    workers = workers or os.cpu_count() or 1
+    offers, items = [], []
+
+    def collect(futures):
+        for f in futures:
+            chunk_offers, chunk_items = f.result()
+            offers.extend(chunk_offers)
+            items.extend(chunk_items)
+
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(catalog, prices_at)) as pool, engine.connect() as conn:
+        result = conn.execution_options(stream_results=True, yield_per=chunk_size).execute(
+            text("SELECT id, datum_vytvoreni, model, cena_celkem, data_json FROM nabidky ORDER BY id").columns(datum_vytvoreni=DateTime))
+        pending = set()
+        for chunk in result.partitions(chunk_size):
+            pending.add(pool.submit(replay_chunk, [tuple(r) for r in chunk]))
+            # Omezení rozpracovaných dávek - paměť nezávisí na velikosti archivu
+            if len(pending) >= 2 * workers:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                collect(done)
+        collect(wait(pending).done)
+    return pd.DataFrame(offers, columns=OFFER_COLUMNS).sort_values('id'), pd.DataFrame(items, columns=ITEM_COLUMNS)
+
+def drift_report(df_offers, df_items, tolerance=1.0):
+    """Souhrn odchylek po modelech, geometrických kategoriích a položkách."""
+    ok = df_offers[df_offers['stav'] == 'ok'].copy()
+    ok['zmena'] = ok['rozdil'].abs() > tolerance
+    ok['abs_rozdil'] = ok['rozdil'].abs()
+    agg = {'nabidek': ('id', 'count'), 'zmenenych': ('zmena', 'sum'), 'rozdil_celkem': ('rozdil', 'sum'),
+           'rozdil_prum_pct': ('rozdil_pct', 'mean'), 'max_abs_rozdil': ('abs_rozdil', 'max')}
+    report = {
+        'model': ok.groupby('model').agg(**agg),
+        'kategorie': ok.groupby('kategorie').agg(**agg),
+        'stav': df_offers.groupby('stav')['id'].count().rename('nabidek').to_frame(),
+    }
+    if not df_items.empty:
+        items = df_items.assign(zmena=df_items['rozdil'].abs() > tolerance)
+        report['polozka'] = items.groupby('polozka').agg(nabidek=('id', 'nunique'), zmenenych=('zmena', 'sum'), rozdil_celkem=('rozdil', 'sum'))
+    return report
+
+def main():
+    parser = argparse.ArgumentParser(description="Přepočet archivních nabídek podle aktuální cenové logiky.")
+    parser.add_argument("--ceny", default="aktualni", help="aktualni | datum-nabidky | RRRR-MM-DD")
+    parser.add_argument("--workers", type=int, default=None, help="počet procesů (výchozí = počet jader)")
+    parser.add_argument("--tolerance", type=float, default=1.0, help="rozdíl v Kč, od kterého je nabídka změněná")
+    parser.add_argument("--out", default=None, help="prefix CSV výstupů (<out>_nabidky.csv, <out>_polozky.csv)")
+    parser.add_argument("--db", default=None, help="URL databáze (výchozí DATABASE_URL)")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    df_offers, df_items = run_replay(get_engine(args.db), args.ceny, args.workers)
+    elapsed = time.perf_counter() - start
+    print(f"Přepočteno {len(df_offers)} nabídek za {elapsed:.1f} s ({len(df_offers) / elapsed if elapsed else 0:,.0f} nabídek/s)\n")
+    if df_offers.empty: return
+    with pd.option_context('display.width', 200, 'display.max_rows', 200, 'display.float_format', '{:,.1f}'.format):
+        for name, df in drift_report(df_offers, df_items, args.tolerance).items():
+            print(f"--- Odchylky dle: {name} ---")
+            print(df.to_string())
+            print()
+    if args.out:
+        df_offers.to_csv(f"{args.out}_nabidky.csv", index=False, sep=';', encoding='utf-8-sig')
+        if not df_items.empty: df_items.to_csv(f"{args.out}_polozky.csv", index=False, sep=';', encoding='utf-8-sig')
+
+if __name__ == "__main__":
+    main()